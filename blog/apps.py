@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.apps import AppConfig
+
+
+class BlogConfig(AppConfig):
+    name = 'blog'
+    verbose_name = 'Blog'
+
+    def ready(self):
+        from blog import checks # registers the system checks
+        from blog import signals
+        signals.register_signal_handlers()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Year, month and day archives below BlogType pages, addressed with the same DATE_FORMAT
+segments post URLs use: /blog/2016/, /blog/2016/Jan/ and /blog/2016/Jan/31/ (a day segment
+is appended when DATE_FORMAT has none).
+
+Archive listings filter posts on a date range, which the index on BlogPost.date serves. The
+per-month post counts for the archive sidebar are stored in BlogArchiveCount: saves and
+deletes of live posts move one post between months, and rebuild_blog_archive recounts.
+"""
+from __future__ import unicode_literals
+
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F
+
+from blog import settings
+
+YEAR = 'year'
+MONTH = 'month'
+DAY = 'day'
+ARCHIVE_KINDS = (YEAR, MONTH, DAY)
+
+_KIND_DIRECTIVES = {
+    YEAR: ('%Y',),
+    MONTH: ('%b', '%B', '%m'),
+    DAY: ('%d',),
+}
+
+Archive = namedtuple('Archive', ['kind', 'start', 'end'])
+
+
+def archive_directives(kind):
+    """
+    The strftime directives of the URL segments addressing an archive of this kind.
+    """
+    directives = [directive for directive in settings.DATE_FORMAT.split('/') if directive]
+    for i, directive in enumerate(directives):
+        if any(wanted in directive for wanted in _KIND_DIRECTIVES[kind]):
+            return directives[:i + 1]
+    if kind == DAY and archive_directives(MONTH):
+        return directives + ['%d']
+    return None
+
+def archive_segments(kind, day):
+    directives = archive_directives(kind)
+    if directives is None:
+        return None
+    return [getattr(day.strftime(directive), settings.DATE_FUNCTION)() for directive in directives]
+
+def archive_for(kind, day):
+    if kind == YEAR:
+        start = date(day.year, 1, 1)
+        return Archive(kind, start, date(day.year + 1, 1, 1))
+    if kind == MONTH:
+        start = date(day.year, day.month, 1)
+        return Archive(kind, start, date(day.year + day.month // 12, day.month % 12 + 1, 1))
+    return Archive(kind, day, day + timedelta(days=1))
+
+def parse_archive_path(path_components):
+    """
+    Return the Archive addressed by path components below a BlogType, or None. Only the
+    canonical spelling of each archive matches.
+    """
+    for kind in ARCHIVE_KINDS:
+        directives = archive_directives(kind)
+        if directives is None or len(directives) != len(path_components) or '%Y' not in ''.join(directives):
+            continue
+        try:
+            day = datetime.strptime('/'.join(path_components), '/'.join(directives)).date()
+        except ValueError:
+            return None
+        if archive_segments(kind, day) != list(path_components):
+            return None
+        return archive_for(kind, day)
+    return None
+
+def archive_url_path(blog_url_path, kind, day):
+    segments = archive_segments(kind, day)
+    if segments is None: # DATE_FORMAT has no segment for this kind
+        return None
+    return blog_url_path + '/'.join(segments) + '/'
+
+
+def compute_month_counts(blog_path):
+    """
+    [(year, month, count)] for the live posts below the BlogType at blog_path, newest first,
+    counted by the database per day.
+    """
+    from blog.models import BlogPost
+
+    days = (BlogPost.objects.live().filter(path__startswith=blog_path).exclude(path=blog_path)
+            .order_by().values_list('date').annotate(count=Count('pk')))
+    counts = Counter()
+    for day, count in days:
+        counts[(day.year, day.month)] += count
+    return sorted(((year, month, count) for (year, month), count in counts.items()), reverse=True)
+
+def get_month_counts(blog_id):
+    from blog.models import BlogArchiveCount
+
+    return list(BlogArchiveCount.objects.filter(blog_id=blog_id, count__gt=0)
+                .order_by('-year', '-month').values_list('year', 'month', 'count'))
+
+def change_month_count(blog_id, day, delta):
+    from blog.models import BlogArchiveCount
+
+    updated = BlogArchiveCount.objects.filter(blog_id=blog_id, year=day.year, month=day.month).update(count=F('count') + delta)
+    if not updated and delta > 0:
+        try:
+            with transaction.atomic():
+                BlogArchiveCount.objects.create(blog_id=blog_id, year=day.year, month=day.month, count=delta)
+        except IntegrityError:
+            # created concurrently
+            BlogArchiveCount.objects.filter(blog_id=blog_id, year=day.year, month=day.month).update(count=F('count') + delta)
+
+@transaction.atomic
+def rebuild_month_counts(blog):
+    """
+    Recount the months of a BlogType; returns the number of months with posts.
+    """
+    from blog.models import BlogArchiveCount
+
+    counts = compute_month_counts(blog.path)
+    BlogArchiveCount.objects.filter(blog_id=blog.pk).delete()
+    BlogArchiveCount.objects.bulk_create([BlogArchiveCount(blog_id=blog.pk, year=year, month=month, count=count)
+                                          for year, month, count in counts])
+    return len(counts)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Synthetic blog data and the view paths the query budgets in tests.py and the benchmark_blog
+command measure.
+
+generate_blog builds an AjaxBlogPage > BlogType tree with nested categories, tags, featured
+images with their renditions and StreamField or rich text bodies, filling the same derived
+tables publishing would. Every measured path has a query budget that must not grow with the
+number of posts.
+"""
+from __future__ import unicode_literals
+
+import json
+import random
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from wagtail.wagtailcore.models import Page, Site
+from wagtail.wagtailimages.formats import get_image_formats
+from wagtail.wagtailimages.models import Image, Filter, Rendition
+
+from blog import settings
+from blog.archives import MONTH, archive_segments, parse_archive_path, rebuild_month_counts
+from blog.bulk import bulk_add_pages
+from blog.models import AjaxBlogPage, BlogType, BlogPost
+from blog.templatetags.blog_tags import blog_related_posts
+
+BenchmarkData = namedtuple('BenchmarkData', ['ajax_page', 'blog', 'posts', 'category', 'deep_category', 'tag'])
+
+
+def _body(rng, post_number, images, link_id):
+    link = '<a linktype="page" id="%d">an earlier post</a>' % link_id if link_id else 'no link'
+    paragraphs = ['<p>Post %d, paragraph %d, with %s and some <b>bold</b> text.</p>' % (post_number, i, link) for i in range(3)]
+    if not settings.USE_STREAMFIELD:
+        return ''.join(paragraphs)
+    blocks = [{'type': 'h2', 'value': 'Post %d' % post_number}]
+    blocks += [{'type': 'paragraph', 'value': paragraph} for paragraph in paragraphs]
+    if images:
+        blocks.append({'type': 'image', 'value': {'image': rng.choice(images).pk, 'format': get_image_formats()[0].name,
+                                                  'caption': 'Caption', 'alt_text': 'Alt', 'attribution': ''}})
+    return json.dumps(blocks)
+
+def _images(count):
+    last_pk = Image.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    Image.objects.bulk_create([Image(title='Image %d' % i, file='original_images/benchmark_%d.jpg' % i, width=1600, height=1200)
+                               for i in range(count)])
+    images = list(Image.objects.filter(pk__gt=last_pk))
+    specs = set([settings.LISTING_IMAGE_FILTER] + [format.filter_spec for format in get_image_formats()])
+    renditions = []
+    for spec in specs:
+        image_filter = Filter.objects.get_or_create(spec=spec)[0]
+        renditions.extend(Rendition(image=image, filter=image_filter, file='images/benchmark_%d.%s.jpg' % (image.pk, spec),
+                                    width=150, height=150, focal_point_key='') for image in images)
+    Rendition.objects.bulk_create(renditions)
+    return images
+
+def _categories(blog, breadth, depth):
+    from blog.models import BlogCategory
+
+    categories = []
+    parents = [blog]
+    for level in range(depth):
+        children = []
+        for parent in parents:
+            for i in range(breadth):
+                slug = '%s-%d' % (parent.slug, i) if level else 'category-%d' % i
+                children.append(parent.add_child(instance=BlogCategory(title=slug, slug=slug)))
+        categories.extend(children)
+        parents = children
+    return categories
+
+def generate_blog(posts=10000, tags=50, tags_per_post=3, images=20, category_breadth=3, category_depth=2, seed=0, chunk_size=500):
+    """
+    Build a blog with the given number of posts below the default site's root page.
+    """
+    rng = random.Random(seed)
+    site_root = Site.objects.get(is_default_site=True).root_page
+    ajax_page = site_root.add_child(instance=AjaxBlogPage(title="Benchmark", slug='benchmark-%d' % seed))
+    blog = ajax_page.add_child(instance=BlogType(title="Blog", slug='blog'))
+    ajax_page.blog_page = blog
+    ajax_page.save()
+
+    image_list = _images(images) if settings.USE_FEATURED_IMAGES or settings.USE_STREAMFIELD else []
+    categories = _categories(blog, category_breadth, category_depth) if settings.USE_CATEGORIES else []
+    leaf_categories = [category for category in categories if category.depth == blog.depth + category_depth] or categories
+    tag_names = ['tag-%d' % i for i in range(tags)] if settings.USE_TAGS else []
+
+    start = date.today()
+    post_ids = []
+    for offset in range(0, posts, chunk_size):
+        chunk = []
+        for n in range(offset, min(offset + chunk_size, posts)):
+            post = BlogPost(title='Post %d' % n, slug='post-%d' % n, date=start - timedelta(days=n // 3),
+                            content=_body(rng, n, image_list, post_ids[-1] if post_ids else None))
+            if settings.USE_FEATURED_IMAGES and image_list:
+                post.featured_image = rng.choice(image_list)
+            if leaf_categories:
+                post.category = rng.choice(leaf_categories)
+            chunk.append(post)
+        bulk_add_pages(blog, chunk)
+        post_ids.extend(post.pk for post in chunk)
+
+        if tag_names:
+            from blog.models import BlogPostTag
+            from taggit.models import Tag
+            if offset == 0:
+                existing = set(Tag.objects.filter(name__in=tag_names).values_list('name', flat=True))
+                Tag.objects.bulk_create([Tag(name=name, slug=name) for name in tag_names if name not in existing])
+            tag_ids = list(Tag.objects.filter(name__in=tag_names).values_list('pk', flat=True))
+            BlogPostTag.objects.bulk_create([BlogPostTag(content_object_id=post.pk, tag_id=tag_id)
+                                             for post in chunk for tag_id in rng.sample(tag_ids, tags_per_post)])
+
+    # what publishing would have stored
+    rebuild_month_counts(blog)
+    out = StringIO()
+    if settings.EXPAND_RICH_TEXT_ON_PUBLISH:
+        call_command('rebuild_blog_expanded_text', stdout=out)
+    call_command('rebuild_blog_taxonomy', stdout=out)
+    if settings.USE_LISTING_TABLE:
+        call_command('rebuild_blog_listing', stdout=out)
+    if settings.USE_RELATED_POSTS:
+        call_command('rebuild_blog_related', stdout=out)
+
+    sample = list(BlogPost.objects.filter(pk__in=[post_ids[0], post_ids[len(post_ids) // 2], post_ids[-1]]))
+    return BenchmarkData(ajax_page, blog, sample, categories[0] if categories else None, categories[-1] if categories else None,
+                         tag_names[0] if tag_names else None)
+
+
+def forget_blog(data):
+    """
+    Drop what the caches hold about a generated blog before its pages are rolled back, as
+    PostImporter.finish does after an import: otherwise version tokens, category trees and
+    routes of pages that no longer exist outlive the benchmark. Rows of the derived
+    tables go with the rollback.
+    """
+    from blog.caching import ancestor_paths, bump_paths
+    from blog.categories import invalidate_category_tree
+    from blog.routing import clear_page_paths, invalidate_routes
+
+    paths = ancestor_paths(data.blog.path, inclusive=True)
+    paths.update(Page.objects.descendant_of(data.blog).not_type(BlogPost).values_list('path', flat=True))
+    tag_names = ()
+    if settings.USE_TAGS:
+        from blog.models import BlogPostTag
+        tag_names = set(BlogPostTag.objects.filter(content_object__path__startswith=data.blog.path).values_list('tag__name', flat=True))
+    bump_paths(paths, tag_names)
+    clear_page_paths()
+    if settings.USE_CATEGORIES:
+        invalidate_category_tree()
+    if settings.ROUTE_CACHE_ALIAS:
+        invalidate_routes(data.blog)
+
+
+def _request(site, **params):
+    request = RequestFactory().get('/', params)
+    request.site = site
+    return request
+
+def _components(page, below):
+    return page.url_path[len(below.url_path):].strip('/').split('/')
+
+def _last_page(data, site, **params):
+    posts = data.blog.get_posts(_request(site, **params)).count()
+    return max(1, (posts + settings.POSTS_PER_PAGE - 1) // settings.POSTS_PER_PAGE)
+
+def _paths(data):
+    """
+    (name, callable) for every measured path.
+    """
+    site = Site.objects.get(is_default_site=True)
+    post = data.posts[len(data.posts) // 2]
+    last_page = _last_page(data, site)
+    archive = parse_archive_path(archive_segments(MONTH, post.date))
+    paths = [
+        ('route_post', lambda: data.blog.route(_request(site), _components(post, data.blog))),
+        ('post_context', lambda: post.get_context(_request(site))),
+        ('index_context', lambda: data.blog.get_context(_request(site))),
+        ('index_context_deep', lambda: data.blog.get_context(_request(site, page=last_page))),
+        ('index_context_archive', lambda: data.blog.get_context(_request(site), archive=archive)),
+        ('ajax_route', lambda: data.ajax_page.route(_request(site), _components(post, data.ajax_page))),
+        ('ajax_context', lambda: data.ajax_page.get_context(_request(site), true_request_page=post)),
+        ('rendered_content', lambda: post.rendered_content),
+        ('related_posts', lambda: list(blog_related_posts(post)['posts'])),
+    ]
+    if data.tag:
+        last_tag_page = _last_page(data, site, tag=data.tag)
+        paths += [
+            ('post_context_tag', lambda: post.get_context(_request(site, tag=data.tag))),
+            ('index_context_tag', lambda: data.blog.get_context(_request(site, tag=data.tag))),
+            ('index_context_tag_deep', lambda: data.blog.get_context(_request(site, tag=data.tag, page=last_tag_page))),
+        ]
+    if data.category:
+        paths += [
+            ('route_category', lambda: data.blog.route(_request(site), _components(data.deep_category, data.blog))),
+            ('category_context', lambda: data.category.get_context(_request(site))),
+        ]
+    return paths
+
+def query_budgets():
+    """
+    Most queries each path may run once caches are warm, under the current settings.
+    """
+    budgets = {
+        'route_post': 2, # child lookup, specific page
+        'route_category': 1, # category tree from cache, one get
+        'post_context': 2, # older and newer neighbour
+        'post_context_tag': 2,
+        'index_context': 4, # count, page, renditions, tags
+        'index_context_deep': 4,
+        'index_context_archive': 4, # date range scan
+        'index_context_tag': 4,
+        'index_context_tag_deep': 4,
+        'category_context': 4,
+        'ajax_route': 4, # ajax page child, blog specific, then route_post
+        'ajax_context': 0,
+        'rendered_content': 1, # stored expansions
+        'related_posts': 1,
+    }
+    if settings.USE_STREAMFIELD:
+        budgets['rendered_content'] += 2 # prefetched images and renditions
+    if settings.ROUTE_CACHE_ALIAS:
+        budgets['route_post'] = 1
+    return budgets
+
+
+def _story_html(paragraphs=50):
+    html = []
+    for i in range(paragraphs):
+        html.append('<p>Paragraph %d with <b>bold</b>, <i>italic</i> and <a href="/x/">a link</a>.</p>' % i)
+        if i % 10 == 5:
+            html.append('<p></p>loose text<br/>more <b>text<br/></b><p>before<ul><li>one</li><li>two</li></ul>after</p>')
+    return ''.join(html)
+
+def story_html_benchmark(repeat=20):
+    """
+    [(name, sorted timings)] for cleaning one StoryTextArea submission: the streaming
+    normalizer, and the BeautifulSoup/html5lib parse it replaced when those are installed.
+    """
+    from blog.richtext import normalize_story_html
+
+    html = _story_html()
+    candidates = [('normalize_story_html', lambda: normalize_story_html(html))]
+    try:
+        from bs4 import BeautifulSoup
+        import html5lib
+    except ImportError:
+        pass
+    else:
+        candidates.append(('beautifulsoup_html5lib', lambda: BeautifulSoup(html, 'html5lib').body))
+    results = []
+    for name, fn in candidates:
+        timings = []
+        for i in range(repeat):
+            start = time.time()
+            fn()
+            timings.append(time.time() - start)
+        results.append((name, sorted(timings)))
+    return results
+
+
+def measure(fn, repeat=10):
+    """
+    Return (sorted timings in seconds, queries of one warm run) for fn.
+    """
+    fn() # warm process caches: category tree, page paths, site root paths
+    with CaptureQueriesContext(connection) as queries:
+        fn()
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        fn()
+        timings.append(time.time() - start)
+    return sorted(timings), len(queries)
+
+def run_benchmarks(data, repeat=10):
+    """
+    Return [(name, timings, queries, budget)] for every path.
+    """
+    budgets = query_budgets()
+    results = []
+    for name, fn in _paths(data):
+        timings, queries = measure(fn, repeat)
+        results.append((name, timings, queries, budgets[name]))
+    return results
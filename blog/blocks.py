@@ -12,9 +12,8 @@ from django.utils.functional import cached_property
 
 import json
 from wagtail.wagtailcore.fields import RichTextArea
-from bs4 import BeautifulSoup, Tag, NavigableString
 
-from wagtail.wagtailcore.rich_text import RichText, expand_db_html
+from wagtail.wagtailcore.rich_text import RichText
 from django.utils.safestring import mark_safe
 
 from wagtail.wagtailimages.blocks import ImageChooserBlock
@@ -23,24 +22,32 @@ from wagtail.wagtailimages.models import SourceImageIOError
 from django.utils.html import escape
 from django.template.loader import render_to_string
 
+from .renditions import prefetched_renditions, get_prefetched_image, get_prefetched_rendition
+from .richtext import normalize_story_html
+from .expansion import expand_source
+from .instrumentation import timed
+
 class StoryText(RichText):
     def __str__(self):
-        return mark_safe(expand_db_html(self.source))
+        # stored at publish time when rendered inside expanded_rich_text(post)
+        return mark_safe(expand_source(self.source))
 
 class StoryTextArea(RichTextArea):
     def render_js_init(self, id_, name, value):
         return "makeRichTextEditable({0});".format(json.dumps(id_))
 
-    def value_from_datadict(self, data, files, name):
-        # here might be the best place to clean empty paragraphs, unwrapped text, etc.
-        # TODO: clean up some html
-        # remove: empty ps, replace <br />text with <p>text</p>, make sure lists are outside of paragraphs
-        clean_data = super(StoryTextArea, self).value_from_datadict(data, files, name)
-        clean_html = BeautifulSoup(clean_data,'html5lib').body
-        empty_ps = clean_html.findAll(lambda tag: tag.name == 'p' and tag.find(True) is None and (tag.string is None or tag.string.strip()==""))
-
+    # (submitted value, normalized value) of the last call: a save asks for the same value
+    # more than once (cleaning, has_changed). Shared by every block of a type.
+    _normalized = (None, None)
 
-        return clean_data
+    def value_from_datadict(self, data, files, name):
+        submitted = data.get(name)
+        normalized = self._normalized
+        if submitted is None or normalized[0] != submitted:
+            clean_data = super(StoryTextArea, self).value_from_datadict(data, files, name)
+            normalized = (submitted, normalize_story_html(clean_data))
+            self._normalized = normalized
+        return normalized[1]
 
 class StoryTextBlock(RichTextBlock):
     @cached_property
@@ -59,11 +66,18 @@ class StoryTextBlock(RichTextBlock):
     class Meta:
         classname = 'widget-rich_text_area'
 
+class PrefetchedImageChooserBlock(ImageChooserBlock):
+    def to_python(self, value):
+        image = get_prefetched_image(value)
+        if image is not None:
+            return image
+        return super(PrefetchedImageChooserBlock, self).to_python(value)
+
 class ImageFormatChoiceBlock(FieldBlock):
     field = forms.ChoiceField(choices=[(format.name, format.label) for format in get_image_formats()])
 
 class ImageBlock(StructBlock):
-    image = ImageChooserBlock()
+    image = PrefetchedImageChooserBlock()
     format = ImageFormatChoiceBlock()
     caption = CharBlock(required=False)
     alt_text = CharBlock(required=False)
@@ -73,6 +87,7 @@ class ImageBlock(StructBlock):
         icon = "image"
         template = "blog/blocks/imageblock.html"
 
+    @timed('image-block')
     def render(self,value):
         template = getattr(self.meta, 'template', None)
 
@@ -82,8 +97,10 @@ class ImageBlock(StructBlock):
 
         # Comes from wagtailimages\formats.py Format.image_to_html
         # TODO: possibly refactor wagtail codebase so Format can return silent-failing rendition 
+        rendition = get_prefetched_rendition(image, format.filter_spec)
         try:
-            rendition = image.get_rendition(format.filter_spec)
+            if rendition is None:
+                rendition = image.get_rendition(format.filter_spec)
         except SourceImageIOError:
             # Image file is (probably) missing from /media/original_images - generate a dummy
             # rendition so that we just output a broken image, rather than crashing out completely
@@ -130,4 +147,9 @@ class StoryBlock(StreamBlock):
     embed = EmbedBlock(icon="code")
 
     class Meta:
-        template = "blog/blocks/storyblock.html"
\ No newline at end of file
+        template = "blog/blocks/storyblock.html"
+
+    @timed('story-block')
+    def render(self, value):
+        with prefetched_renditions(value):
+            return super(StoryBlock, self).render(value)
\ No newline at end of file
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Adding many pages at once, for generated and imported content.
+
+Page.add_child locks and re-reads the parent for every page. bulk_add_pages works out the
+treebeard paths of a whole batch of new children from the parent's last child and saves
+them without Page.save's per-page validation, then updates the parent's numchild once.
+"""
+from __future__ import unicode_literals
+
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from wagtail.wagtailcore.models import Page
+
+
+def next_child_step(parent):
+    last_path = Page.objects.filter(path__startswith=parent.path, depth=parent.depth + 1).order_by('-path').values_list('path', flat=True).first()
+    return Page._str2int(last_path[-Page.steplen:]) + 1 if last_path else 1
+
+@transaction.atomic
+def bulk_add_pages(parent, pages):
+    """
+    Save unsaved page instances (any Page subclass) as the last children of parent, live and
+    published now. Returns the pages, with their pks set.
+    """
+    pages = list(pages)
+    if not pages:
+        return pages
+    step = next_child_step(parent)
+    now = timezone.now()
+    for page in pages:
+        page.path = Page._get_path(parent.path, parent.depth + 1, step)
+        page.depth = parent.depth + 1
+        page.numchild = 0
+        page.live = True
+        page.has_unpublished_changes = False
+        page.first_published_at = page.first_published_at or now
+        page.latest_revision_created_at = page.latest_revision_created_at or now
+        page.set_url_path(parent)
+        # plain model save: the multi-table insert, without Page.save's full_clean and tree reads
+        models.Model.save(page)
+        step += 1
+
+    Page.objects.filter(pk=parent.pk).update(numchild=F('numchild') + len(pages))
+    parent.numchild += len(pages)
+    return pages
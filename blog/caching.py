@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Caching helpers: the rendered post content cache (enabled by setting RENDER_CACHE_ALIAS), the
+per-index version tokens bumped whenever a post below or in an index changes, and HTTP
+validators built from them.
+"""
+from __future__ import unicode_literals
+
+import calendar
+import hashlib
+import json
+import time
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.encoding import force_bytes
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.utils.safestring import mark_safe
+
+from wagtail.wagtailcore.models import Page
+
+from blog import settings
+from blog.expansion import render_post_content
+from blog.instrumentation import timed
+
+
+def get_render_cache():
+    if settings.RENDER_CACHE_ALIAS:
+        return caches[settings.RENDER_CACHE_ALIAS]
+
+def content_fingerprint(post):
+    """
+    Digest of the stored stream data. Unlike the latest revision timestamp, this also tells
+    apart previews of unsaved drafts, which share their id with the live page.
+    """
+    content = post.content
+    if getattr(content, 'is_lazy', False):
+        # raw JSON from the database; avoids to_python, which queries images and pages
+        data = content.stream_data
+    else:
+        data = content.stream_block.get_prep_value(content)
+    return hashlib.md5(force_bytes(json.dumps(data, sort_keys=True))).hexdigest()
+
+def render_cache_key(post):
+    return 'blog:content:%d:%s' % (post.pk or 0, content_fingerprint(post))
+
+@timed('render-content')
+def render_content(post, force=False):
+    """
+    Return post.content rendered to HTML, from the render cache when possible. Renders larger
+    than RENDER_CACHE_MAX_SIZE are not stored so a few huge posts cannot evict the rest.
+    """
+    cache = get_render_cache()
+    if cache is None:
+        return render_post_content(post)
+
+    key = render_cache_key(post)
+    if not force:
+        html = cache.get(key)
+        if html is not None:
+            return mark_safe(html)
+
+    html = render_post_content(post)
+    if len(html) <= settings.RENDER_CACHE_MAX_SIZE:
+        cache.set(key, html, settings.RENDER_CACHE_TIMEOUT)
+    return html
+
+def refresh_rendered_content(post):
+    """
+    Called on publish: drop the render of the previously published content and store the new one.
+    """
+    cache = get_render_cache()
+    if cache is None:
+        return
+    pointer = 'blog:content-key:%d' % post.pk
+    old_key = cache.get(pointer)
+    new_key = render_cache_key(post)
+    if old_key and old_key != new_key:
+        cache.delete(old_key)
+    render_content(post, force=True)
+    cache.set(pointer, new_key, settings.RENDER_CACHE_TIMEOUT)
+
+
+def _version_key(path):
+    return 'blog:version:%s' % path
+
+def get_index_version(path):
+    """
+    Return (token, timestamp) for the index page at the treebeard path, which changes whenever
+    a post below it, or filed in it as a category, is published or unpublished. Keyed by
+    path so posts can look up their parent's version without a query.
+    """
+    cache = caches[settings.CACHE_ALIAS]
+    version = cache.get(_version_key(path))
+    if version is None:
+        version = (uuid4().hex, int(time.time()))
+        cache.set(_version_key(path), version, None)
+    return version
+
+def _tag_version_key(path, tag):
+    return 'blog:version:%s:%s' % (path, hashlib.md5(force_bytes(tag)).hexdigest())
+
+def get_tag_version(path, tag):
+    """
+    Like get_index_version, for the ?tag= filtered listing of an index; only changes when a
+    post with that tag is published or unpublished.
+    """
+    cache = caches[settings.CACHE_ALIAS]
+    version = cache.get(_tag_version_key(path, tag))
+    if version is None:
+        version = (uuid4().hex, int(time.time()))
+        cache.set(_tag_version_key(path, tag), version, None)
+    return version
+
+def get_listing_version(index, request):
+    tag = request.GET.get('tag') if settings.USE_TAGS else None
+    if tag:
+        return get_tag_version(index.path, tag)
+    return get_index_version(index.path)
+
+def ancestor_paths(path, inclusive=False):
+    end = len(path) + 1 if inclusive else len(path)
+    return set(path[:i] for i in range(Page.steplen, end, Page.steplen))
+
+def bump_paths(paths, tag_names=()):
+    """
+    Give the indexes at the treebeard paths, and their listings filtered by each of
+    tag_names, a new version.
+    """
+    version = (uuid4().hex, int(time.time()))
+    versions = dict((_version_key(path), version) for path in paths)
+    for tag in set(tag_names):
+        versions.update((_tag_version_key(path, tag), version) for path in paths)
+    caches[settings.CACHE_ALIAS].set_many(versions, None)
+
+def bump_index_versions(post, tag_names=(), category_ids=()):
+    """
+    Bump the versions of every index the post is listed in: its ancestors, its category
+    chain and, for each of tag_names, their tag filtered listings. Pass the tags and
+    categories the post had before the change as well, so listings it left are refreshed.
+    """
+    paths = ancestor_paths(post.path)
+    if settings.USE_CATEGORIES:
+        from blog.categories import get_category_tree
+        tree = get_category_tree()
+        for category_id in set(category_ids) | set([post.category_id]):
+            if category_id:
+                paths.update(node.path for node in tree.ancestors(category_id))
+    bump_paths(paths, tag_names)
+
+def serve_cached(request, key_parts, respond):
+    """
+    Full-response cache for anonymous GETs, enabled by RESPONSE_CACHE_ALIAS. key_parts must
+    include a version from this module so publishing invalidates the entry. Responses are
+    stored with their headers; those setting cookies are meant for one visitor and are not
+    stored at all.
+    """
+    user = getattr(request, 'user', None)
+    if (not settings.RESPONSE_CACHE_ALIAS or request.method != 'GET' or getattr(request, 'is_preview', False)
+            or (user is not None and user.is_authenticated())):
+        return respond()
+
+    cache = caches[settings.RESPONSE_CACHE_ALIAS]
+    key = 'blog:response:%s' % hashlib.md5(force_bytes(repr(key_parts))).hexdigest()
+    cached = cache.get(key)
+    if cached is not None:
+        response = HttpResponse(cached['content'])
+        for header, value in cached['headers']:
+            response[header] = value
+        return response
+
+    response = respond()
+    if response.status_code == 200:
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        if not response.cookies:
+            cache.set(key, {'content': response.content, 'headers': list(response.items())}, settings.RESPONSE_CACHE_TIMEOUT)
+    return response
+
+def not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag in [value.strip() for value in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    return bool(if_modified_since and last_modified and last_modified <= if_modified_since)
+
+def timestamp(value):
+    return calendar.timegm(value.utctimetuple()) if value else 0
+
+def serve_conditionally(request, respond, etag_parts, last_modified, cache_control=None):
+    """
+    Answer a conditional GET with a 304 before anything is rendered, or call respond() and
+    attach the validators to its response. Previews and unsafe methods always get respond().
+    """
+    if not settings.CONDITIONAL_GET or request.method not in ('GET', 'HEAD') or getattr(request, 'is_preview', False):
+        return respond()
+
+    etag = quote_etag(hashlib.md5(force_bytes(repr(etag_parts))).hexdigest())
+    if not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        response = respond()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    if cache_control:
+        patch_cache_control(response, **cache_control)
+    return response
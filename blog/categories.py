@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cached snapshot of every BlogCategory page, used for subcategory lookups, breadcrumbs and
+routing without walking the page tree.
+"""
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+from django.core.cache import caches
+
+from blog import settings
+
+CATEGORY_TREE_CACHE_KEY = 'blog:category-tree'
+
+CategoryNode = namedtuple('CategoryNode', ['id', 'slug', 'title', 'path', 'depth', 'url_path', 'live'])
+
+
+class CategoryTree(object):
+    def __init__(self, rows):
+        self.nodes = [CategoryNode(*row) for row in rows] # ordered by path
+        self.by_id = dict((node.id, node) for node in self.nodes)
+        self.by_url_path = dict((node.url_path, node) for node in self.nodes)
+
+    def get(self, category_id):
+        return self.by_id.get(category_id)
+
+    def descendant_ids(self, category_id, inclusive=True):
+        node = self.by_id.get(category_id)
+        if node is None:
+            return []
+        return [other.id for other in self.nodes
+                if other.path.startswith(node.path) and (inclusive or other.id != node.id)]
+
+    def ancestors(self, category_id, inclusive=True):
+        """
+        Categories above (and including) this one, outermost first.
+        """
+        node = self.by_id.get(category_id)
+        if node is None:
+            return []
+        return [other for other in self.nodes
+                if node.path.startswith(other.path) and (inclusive or other.id != node.id)]
+
+
+def get_category_tree():
+    from blog.models import BlogCategory
+
+    cache = caches[settings.CATEGORY_TREE_CACHE_ALIAS]
+    rows = cache.get(CATEGORY_TREE_CACHE_KEY)
+    if rows is None:
+        rows = list(BlogCategory.objects.order_by('path').values_list('pk', 'slug', 'title', 'path', 'depth', 'url_path', 'live'))
+        cache.set(CATEGORY_TREE_CACHE_KEY, rows, settings.CATEGORY_TREE_CACHE_TIMEOUT)
+    return CategoryTree(rows)
+
+def invalidate_category_tree():
+    caches[settings.CATEGORY_TREE_CACHE_ALIAS].delete(CATEGORY_TREE_CACHE_KEY)
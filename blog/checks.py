@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+System checks for BLOG_SETTINGS.
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings as django_settings
+from django.core.checks import Warning, register
+
+from blog import settings
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache(alias):
+    """
+    Whether every process sees the same entries in the cache alias.
+    """
+    return django_settings.CACHES.get(alias, {}).get('BACKEND') not in PROCESS_LOCAL_BACKENDS
+
+def shared_cache_settings():
+    # the cache alias settings of enabled features that keep state every process must see
+    names = []
+    if settings.CONDITIONAL_GET or settings.RESPONSE_CACHE_ALIAS:
+        names.append('CACHE_ALIAS')
+    if settings.ROUTE_CACHE_ALIAS:
+        names.append('ROUTE_CACHE_ALIAS')
+    if settings.USE_CATEGORIES:
+        names.append('CATEGORY_TREE_CACHE_ALIAS')
+    return names
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    return [
+        Warning("BLOG_SETTINGS['%s'] names the cache '%s', which is local to each process." % (name, getattr(settings, name)),
+                hint="Other processes keep serving stale pages after a change; use a shared backend such as memcached.",
+                id='blog.W001')
+        for name in shared_cache_settings() if not is_shared_cache(getattr(settings, name))
+    ]
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Publish-time expansion of rich text.
+
+expand_db_html turns <a linktype="..."> and <embed .../> references into real HTML with one
+query per reference, on every render. Instead, publishing a post expands all of its rich text
+sources at once, resolving every page, document and image they reference in one query per
+kind, and stores the result in BlogExpandedText keyed by a digest of each source. Renders
+look the source up and only fall back to expand_db_html for sources that were never
+published, such as previews of drafts.
+
+BlogExpandedTextLink remembers the url_path every linked page had at expansion time, so
+posts are re-expanded when a page they link to moves or changes its slug.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils.encoding import force_bytes
+from django.utils.html import escape
+
+from wagtail.wagtailcore.models import Page
+from wagtail.wagtailcore.rich_text import FIND_A_TAG, FIND_EMBED_TAG, extract_attrs, get_link_handler, get_embed_handler, expand_db_html
+from wagtail.wagtailimages.formats import get_image_format
+from wagtail.wagtailimages.models import SourceImageIOError, get_image_model
+
+from blog import settings
+from blog.instrumentation import timed
+from blog.renditions import iter_raw_stream, find_renditions
+from blog.routing import url_for_path
+
+_expanded = threading.local()
+
+
+def source_digest(source):
+    return hashlib.md5(force_bytes(source)).hexdigest()
+
+def rich_text_sources(post):
+    if not settings.USE_STREAMFIELD:
+        return [post.content] if post.content else []
+    return [value for block_type, value in iter_raw_stream(post.content) if block_type == 'paragraph' and value]
+
+
+def iter_references(source):
+    """
+    Yield ('link' or 'embed', attributes) for every reference in a rich text source.
+    """
+    for match in FIND_A_TAG.finditer(source):
+        yield 'link', extract_attrs(match.group(1))
+    for match in FIND_EMBED_TAG.finditer(source):
+        yield 'embed', extract_attrs(match.group(1))
+
+def reference_id(attrs):
+    return int(attrs['id']) if attrs.get('id', '').isdigit() else None
+
+def linked_page_ids(source):
+    return set(reference_id(attrs) for kind, attrs in iter_references(source)
+               if kind == 'link' and attrs.get('linktype') == 'page' and reference_id(attrs) is not None)
+
+
+def moved_url_path(url_path, moved):
+    """
+    url_path after a move of (old url_path, new url_path) that the database has not caught
+    up with yet: descendants are only rewritten after the moved page's post_save.
+    """
+    if moved and url_path.startswith(moved[0]):
+        return moved[1] + url_path[len(moved[0]):]
+    return url_path
+
+
+class ReferenceResolver(object):
+    """
+    Expands the references of a set of rich text sources with one query per kind of object.
+    """
+    def __init__(self, sources, moved=None):
+        page_ids, document_ids, image_specs = set(), set(), set()
+        for source in sources:
+            for kind, attrs in iter_references(source):
+                object_id = reference_id(attrs)
+                if object_id is None:
+                    continue
+                if kind == 'link' and attrs.get('linktype') == 'page':
+                    page_ids.add(object_id)
+                elif kind == 'link' and attrs.get('linktype') == 'document':
+                    document_ids.add(object_id)
+                elif kind == 'embed' and attrs.get('embedtype') == 'image':
+                    try:
+                        image_specs.add((object_id, get_image_format(attrs.get('format')).filter_spec))
+                    except KeyError:
+                        pass
+
+        self.url_paths = {}
+        if page_ids:
+            self.url_paths = dict((pk, moved_url_path(url_path, moved))
+                                  for pk, url_path in Page.objects.filter(pk__in=page_ids).values_list('pk', 'url_path'))
+
+        self.documents = {}
+        if document_ids:
+            from wagtail.wagtaildocs.models import Document
+            self.documents = Document.objects.in_bulk(document_ids)
+
+        self.images = {}
+        self.renditions = {}
+        if image_specs:
+            self.images = get_image_model().objects.in_bulk(set(image_id for image_id, spec in image_specs))
+            self.renditions = find_renditions(self.images, image_specs)
+
+    def expand_link(self, match):
+        attrs = extract_attrs(match.group(1))
+        linktype = attrs.get('linktype')
+        if linktype == 'page':
+            url_path = self.url_paths.get(reference_id(attrs))
+            url = url_for_path(url_path) if url_path else None
+            return '<a href="%s">' % escape(url) if url else '<a>'
+        if linktype == 'document':
+            document = self.documents.get(reference_id(attrs))
+            return '<a href="%s">' % escape(document.url) if document else '<a>'
+        return get_link_handler(linktype).expand_db_attributes(attrs, False)
+
+    def expand_embed(self, match):
+        attrs = extract_attrs(match.group(1))
+        if attrs.get('embedtype') != 'image':
+            # e.g. media embeds: expanded once here instead of on every render
+            return get_embed_handler(attrs['embedtype']).expand_db_attributes(attrs, False)
+
+        image = self.images.get(reference_id(attrs))
+        if image is None:
+            return '<img>'
+        format = get_image_format(attrs.get('format'))
+        rendition = self.renditions.get((image.pk, format.filter_spec))
+        if rendition is None:
+            try:
+                rendition = image.get_rendition(format.filter_spec)
+            except SourceImageIOError:
+                # same fallback as Format.image_to_html: a broken image rather than an error
+                rendition = image.get_rendition_model()(image=image, width=0, height=0)
+                rendition.file.name = 'not-found'
+        # Format.image_to_html, with the rendition looked up above
+        class_attr = 'class="%s" ' % escape(format.classnames) if format.classnames else ''
+        return '<img %ssrc="%s" width="%d" height="%d" alt="%s">' % (
+            class_attr, escape(rendition.url), rendition.width, rendition.height, attrs.get('alt', ''))
+
+    def expand(self, source):
+        html = FIND_A_TAG.sub(self.expand_link, source)
+        return FIND_EMBED_TAG.sub(self.expand_embed, html)
+
+
+@transaction.atomic
+def expand_posts(posts, moved=None):
+    """
+    Expand and store the rich text of posts, sharing one ReferenceResolver between them.
+    """
+    from blog.models import BlogExpandedText, BlogExpandedTextLink
+
+    posts = list(posts)
+    sources = dict((post.pk, rich_text_sources(post)) for post in posts)
+    resolver = ReferenceResolver(sum(sources.values(), []), moved)
+
+    post_ids = [post.pk for post in posts]
+    BlogExpandedText.objects.filter(post_id__in=post_ids).delete()
+    BlogExpandedTextLink.objects.filter(post_id__in=post_ids).delete()
+    texts, links = [], []
+    for post in posts:
+        html = dict((source_digest(source), resolver.expand(source)) for source in sources[post.pk])
+        texts.append(BlogExpandedText(post_id=post.pk, html=json.dumps(html)))
+        page_ids = set()
+        for source in sources[post.pk]:
+            page_ids |= linked_page_ids(source)
+        links.extend(BlogExpandedTextLink(post_id=post.pk, page_id=page_id, url_path=resolver.url_paths[page_id])
+                     for page_id in page_ids if page_id in resolver.url_paths)
+    BlogExpandedText.objects.bulk_create(texts)
+    BlogExpandedTextLink.objects.bulk_create(links)
+    return posts
+
+def unexpand_post(post):
+    from blog.models import BlogExpandedText, BlogExpandedTextLink
+
+    BlogExpandedText.objects.filter(post_id=post.pk).delete()
+    BlogExpandedTextLink.objects.filter(post_id=post.pk).delete()
+
+def reexpand_linking_posts(page, old_url_path):
+    """
+    Called after page's url_path changed from old_url_path: re-expand the live posts linking
+    to it or below it whose stored links are out of date, and return them.
+    """
+    from blog.models import BlogPost, BlogExpandedTextLink
+
+    moved = (old_url_path, page.url_path)
+    rows = BlogExpandedTextLink.objects.filter(page__path__startswith=page.path).values_list('post_id', 'url_path', 'page__url_path')
+    post_ids = set(post_id for post_id, stored, current in rows if moved_url_path(current, moved) != stored)
+    if not post_ids:
+        return []
+    return expand_posts(BlogPost.objects.live().filter(pk__in=post_ids), moved)
+
+
+def load_expanded_html(post):
+    from blog.models import BlogExpandedText
+
+    if not post.pk or not settings.EXPAND_RICH_TEXT_ON_PUBLISH:
+        return {}
+    html = BlogExpandedText.objects.filter(post_id=post.pk).values_list('html', flat=True).first()
+    return json.loads(html) if html else {}
+
+@contextmanager
+def expanded_rich_text(post):
+    """
+    While active, StoryText renders use the stored expansions of post.
+    """
+    previous = getattr(_expanded, 'html', None)
+    _expanded.html = load_expanded_html(post)
+    try:
+        yield
+    finally:
+        _expanded.html = previous
+
+@timed('rich-text')
+def expand_source(source):
+    """
+    The stored expansion of source if an expanded_rich_text context has it, else expand_db_html.
+    """
+    html = getattr(_expanded, 'html', None)
+    if html:
+        expanded = html.get(source_digest(source))
+        if expanded is not None:
+            return expanded
+    return expand_db_html(source)
+
+def render_post_content(post):
+    with expanded_rich_text(post):
+        if not settings.USE_STREAMFIELD:
+            return expand_source(post.content or '')
+        return post.content.__str__()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Static export of live blog pages, used by the export_blog_static command.
+
+Posts are written to <url>/index.html, listing pages to <index url>/page/<n>/index.html and
+tag listings to <index url>/tag/<tag>/page/<n>/index.html (page 1 also goes to the
+directory itself), so a web server has to map ?page= and ?tag= onto those paths. With
+USE_CURSOR_PAGINATION pages are linked by cursor tokens instead, and every page is written
+to cursor/<token>/ for each token linking to it, for ?cursor=.
+
+A manifest in the output directory remembers, per post, the revision, category, tags and
+neighbours it was exported with, and per index the directories of its listings. Later runs
+only re-render changed posts, their old and new neighbours and the listings they were or
+are part of, and remove the directories of posts, listing pages, tags and indexes that are
+gone.
+"""
+from __future__ import unicode_literals
+
+import json
+import math
+import os
+import shutil
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+from django.utils.encoding import force_text
+from django.utils.http import urlencode, urlquote
+
+from wagtail.wagtailcore.models import Page, Site
+
+from blog import settings
+from blog.pagination import CURSOR_QUERYSTRING_KEY, OLDER, NEWER, encode_position
+
+MANIFEST_NAME = '.blog-export-manifest.json'
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as manifest:
+            return json.load(manifest)
+    except (IOError, ValueError):
+        return {'posts': {}, 'indexes': {}, 'listings': {}}
+
+def save_manifest(output_dir, manifest):
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+
+def get_site():
+    return Site.objects.filter(is_default_site=True).first() or Site.objects.first()
+
+def page_dir(url_path, site):
+    # url_path relative to the site root, e.g. /blog/2016/Jan/post/
+    return url_path[len(site.root_page.url_path):].strip('/')
+
+def listing_dir(base, tag=None, page=1, cursor=None):
+    parts = [base]
+    if tag:
+        parts += ['tag', urlquote(tag, safe='')]
+    if cursor:
+        parts += ['cursor', cursor]
+    elif page > 1:
+        parts += ['page', str(page)]
+    return '/'.join(part for part in parts if part)
+
+def listing_pages(index, base, tag, factory):
+    """
+    [(querystring, output dir)] for every page of an index listing, filtered by tag.
+    """
+    query = {'tag': tag} if tag else {}
+    posts = index.get_posts(factory.get('/', query))
+    per_page = settings.POSTS_PER_PAGE
+    if not settings.USE_CURSOR_PAGINATION:
+        count = posts.count()
+        return [(urlencode(dict(query, page=page)) if page > 1 else urlencode(query), listing_dir(base, tag, page))
+                for page in range(1, max(int(math.ceil(count / float(per_page))), 1) + 1)]
+
+    # a page is linked to as the next page of the one before it (older than that page's
+    # last post) and as the previous page of the one after it (newer than its first post)
+    positions = list(posts.values_list('date', 'pk'))
+    pages = [(urlencode(query), listing_dir(base, tag))]
+    for start in range(0, len(positions), per_page):
+        tokens = []
+        if start:
+            tokens.append(encode_position(OLDER, *positions[start - 1]))
+        if start + per_page < len(positions):
+            tokens.append(encode_position(NEWER, *positions[start + per_page]))
+        pages += [(urlencode(dict(query, **{CURSOR_QUERYSTRING_KEY: token})), listing_dir(base, tag, cursor=token))
+                  for token in tokens]
+    return pages
+
+
+def post_records():
+    """
+    {post id: record} for every live post, with the state that decides what must be re-rendered.
+    """
+    from blog.models import BlogPost
+
+    fields = ['pk', 'path', 'url_path', 'date', 'latest_revision_created_at']
+    if settings.USE_CATEGORIES:
+        fields.append('category_id')
+    records = {}
+    for row in BlogPost.objects.live().values(*fields):
+        records[str(row['pk'])] = {
+            'revision': force_text(row['latest_revision_created_at']),
+            'path': row['path'],
+            'url_path': row['url_path'],
+            'date': row['date'].isoformat(),
+            'category': row.get('category_id'),
+            'tags': [],
+        }
+    if settings.USE_TAGS:
+        from blog.models import BlogPostTag
+        for post_id, tag_name in BlogPostTag.objects.values_list('content_object_id', 'tag__name'):
+            if str(post_id) in records:
+                records[str(post_id)]['tags'].append(tag_name)
+
+    # neighbours as shown by BlogPost.get_context: siblings ordered by POST_ORDERING
+    siblings = {}
+    for post_id, record in records.items():
+        siblings.setdefault(record['path'][:-Page.steplen], []).append(post_id)
+    for post_ids in siblings.values():
+        post_ids.sort(key=lambda post_id: (records[post_id]['date'], int(post_id)), reverse=True)
+        for i, post_id in enumerate(post_ids):
+            records[post_id]['neighbours'] = post_ids[max(i - 1, 0):i] + post_ids[i + 1:i + 2]
+    return records
+
+def post_state(record):
+    return [record['revision'], record['url_path'], record['category'], sorted(record['tags']), record['neighbours']]
+
+
+def plan_export(manifest, full=False):
+    """
+    Return (tasks, stale_dirs, new_manifest). tasks are (page id, querystring, output dir)
+    tuples for the pages to render; stale_dirs are the output dirs of posts, listing pages
+    and indexes that are gone or have moved.
+    """
+    from blog.models import BlogType
+    index_models = [BlogType]
+    if settings.USE_CATEGORIES:
+        from blog.categories import get_category_tree
+        from blog.models import BlogCategory
+        index_models.append(BlogCategory)
+
+    site = get_site()
+    old_posts = manifest.get('posts', {})
+    posts = post_records()
+
+    changed = set(post_id for post_id, record in posts.items()
+                  if full or post_id not in old_posts or old_posts[post_id]['state'] != post_state(record))
+    removed = set(old_posts) - set(posts)
+
+    render_posts = set(changed)
+    stale_dirs = set(old_posts[post_id]['dir'] for post_id in removed)
+    stale_dirs.update(old_posts[post_id]['dir'] for post_id in changed
+                      if post_id in old_posts and old_posts[post_id]['dir'] != page_dir(posts[post_id]['url_path'], site))
+    touched_paths, touched_categories = set(), set()
+    touched_tags = {} # index path: tags of changed posts below it
+    for post_id in changed | removed:
+        for record in (posts.get(post_id), old_posts.get(post_id, {}).get('record')):
+            if not record:
+                continue
+            render_posts.update(neighbour for neighbour in record['neighbours'] if neighbour in posts)
+            for i in range(Page.steplen, len(record['path']), Page.steplen):
+                touched_paths.add(record['path'][:i])
+                touched_tags.setdefault(record['path'][:i], set()).update(record['tags'])
+            if record['category']:
+                touched_categories.add(record['category'])
+    blog_tags = {} # index path: tags of the live posts below it
+    for record in posts.values():
+        for i in range(Page.steplen, len(record['path']), Page.steplen):
+            blog_tags.setdefault(record['path'][:i], set()).update(record['tags'])
+    if settings.USE_CATEGORIES:
+        tree = get_category_tree()
+        for category_id in touched_categories:
+            touched_paths.update(node.path for node in tree.ancestors(category_id))
+
+    tasks = []
+    for post_id in render_posts:
+        tasks.append((int(post_id), '', page_dir(posts[post_id]['url_path'], site)))
+
+    old_indexes = manifest.get('indexes', {})
+    old_listings = manifest.get('listings', {})
+    new_indexes = {}
+    new_listings = {} # index id: {'base': dir, 'dirs': {tag or '': [dirs of its pages]}}
+    factory = RequestFactory()
+    for model in index_models:
+        for index in model.objects.live():
+            base = page_dir(index.url_path, site)
+            revision = force_text(index.latest_revision_created_at)
+            new_indexes[str(index.pk)] = revision
+            old = old_listings.get(str(index.pk))
+            if old is not None and old['base'] != base:
+                old = None # moved: everything is rendered at the new place
+            index_changed = full or old is None or old_indexes.get(str(index.pk)) != revision
+            dirs = {} if index_changed else dict(old['dirs'])
+
+            tags = set()
+            if settings.USE_TAGS and isinstance(index, BlogType):
+                tags = blog_tags.get(index.path, set())
+                for tag in list(dirs):
+                    if tag and tag not in tags:
+                        del dirs[tag] # no post below the index has it any more
+            if index_changed:
+                filters = [None] + sorted(tags)
+            elif index.path in touched_paths:
+                filters = [None] + sorted(touched_tags.get(index.path, set()) & tags)
+            else:
+                filters = []
+            for tag in filters:
+                pages = listing_pages(index, base, tag, factory)
+                tasks.extend((index.pk, querystring, out) for querystring, out in pages)
+                dirs[tag or ''] = [out for querystring, out in pages]
+            new_listings[str(index.pk)] = {'base': base, 'dirs': dirs}
+
+    kept = set(out for listing in new_listings.values() for pages in listing['dirs'].values() for out in pages)
+    for listing in old_listings.values():
+        stale_dirs.update(out for pages in listing['dirs'].values() for out in pages if out not in kept)
+    stale_dirs.difference_update(out for page_id, querystring, out in tasks)
+
+    new_manifest = {
+        'posts': dict((post_id, {'state': post_state(record), 'record': record, 'dir': page_dir(record['url_path'], site)})
+                      for post_id, record in posts.items()),
+        'indexes': new_indexes,
+        'listings': new_listings,
+    }
+    return tasks, sorted(stale_dirs), new_manifest
+
+
+def render_task(output_dir, task):
+    """
+    Render one page to <output_dir>/<dir>/index.html and return the number of bytes written.
+    Runs in worker processes.
+    """
+    page_id, querystring, out = task
+    page = Page.objects.get(pk=page_id).specific
+    request = RequestFactory().get(page.url_path + ('?' + querystring if querystring else ''))
+    request.site = get_site()
+    request.user = AnonymousUser()
+
+    response = page.serve(request)
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    directory = os.path.join(output_dir, out)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(os.path.join(directory, 'index.html'), 'wb') as f:
+        f.write(response.content)
+    return len(response.content)
+
+def remove_dirs(output_dir, dirs):
+    # deepest first, so emptied parents can go too
+    for out in sorted(dirs, key=len, reverse=True):
+        path = os.path.join(output_dir, out, 'index.html')
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            os.rmdir(os.path.join(output_dir, out))
+        except OSError:
+            pass # still holds other pages
+
+def clear_output(output_dir):
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+RSS, Atom and JSON feeds for BlogType and BlogCategory pages, served at <index url>/feed/,
+<index url>/feed/atom/ and <index url>/feed/json/ with an optional ?tag= filter.
+
+Generated feeds are cached per (index, format, tag) together with their ETag and
+Last-Modified, under the index version from blog.caching, so publishing or unpublishing a post
+invalidates them and a warm request, including a 304, needs no database queries.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import json
+from datetime import datetime, time
+
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import feedgenerator
+from django.utils.encoding import force_bytes
+from django.utils.http import http_date, quote_etag
+
+from blog import settings
+from blog.caching import get_index_version, get_tag_version, not_modified, timestamp
+from blog.listing import prefetch_listing, prefetch_listing_tags
+
+FEED_PATH = 'feed'
+FEED_FORMATS = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'json': 'application/json; charset=utf-8',
+}
+
+
+def get_feed_cache():
+    return caches[settings.FEED_CACHE_ALIAS]
+
+def _feed_key(index, feed_format, tag, request):
+    # feeds embed their own absolute url, so feeds served on other hosts or schemes differ
+    version = (get_tag_version(index.path, tag) if tag else get_index_version(index.path))[0]
+    return 'blog:feed:%d:%s:%s:%s' % (index.pk, version, feed_format, hashlib.md5(force_bytes(request.build_absolute_uri())).hexdigest())
+
+def parse_feed_path(path_components):
+    """
+    Return the feed format for path components below an index page, or None if they do not
+    address a feed.
+    """
+    if not path_components or path_components[0] != FEED_PATH:
+        return None
+    if len(path_components) == 1:
+        return 'rss'
+    if len(path_components) == 2 and path_components[1] in FEED_FORMATS:
+        return path_components[1]
+    return None
+
+
+def post_html(post):
+    # rendered_content goes through the render cache and the stored rich text expansions
+    return post.rendered_content
+
+def iter_feed_posts(index, request):
+    from blog.models import BlogType, filter_posts_by_tag
+
+    posts = index.get_posts(request)
+    tag = request.GET.get('tag') if settings.USE_TAGS else None
+    if tag and not isinstance(index, BlogType): # BlogType.get_posts already filters on tag
+        posts = filter_posts_by_tag(posts, tag)
+    posts = list(prefetch_listing(posts)[:settings.FEED_ITEMS])
+    if settings.USE_TAGS:
+        prefetch_listing_tags(posts)
+    return posts
+
+def generate_syndication_feed(index, request, feed_format):
+    feed_class = feedgenerator.Atom1Feed if feed_format == 'atom' else feedgenerator.Rss201rev2Feed
+    feed = feed_class(title=index.title, link=index.full_url, description=index.search_description or index.title,
+                      feed_url=request.build_absolute_uri())
+    last_modified = None
+    for post in iter_feed_posts(index, request):
+        feed.add_item(
+            title=post.title,
+            link=post.full_url,
+            unique_id=post.full_url,
+            description=post_html(post),
+            pubdate=datetime.combine(post.date, time()),
+            updateddate=post.latest_revision_created_at,
+            categories=[tag.name for tag in post.listing_tags] if settings.USE_TAGS else None,
+        )
+        if post.latest_revision_created_at and (last_modified is None or post.latest_revision_created_at > last_modified):
+            last_modified = post.latest_revision_created_at
+    return feed.writeString('utf-8'), last_modified
+
+def generate_json_feed(index, request):
+    # https://jsonfeed.org/version/1
+    items = []
+    last_modified = None
+    for post in iter_feed_posts(index, request):
+        item = {
+            'id': post.full_url,
+            'url': post.full_url,
+            'title': post.title,
+            'content_html': post_html(post),
+            'date_published': post.date.isoformat(),
+        }
+        if post.latest_revision_created_at:
+            item['date_modified'] = post.latest_revision_created_at.isoformat()
+            if last_modified is None or post.latest_revision_created_at > last_modified:
+                last_modified = post.latest_revision_created_at
+        if settings.USE_TAGS:
+            item['tags'] = [tag.name for tag in post.listing_tags]
+        items.append(item)
+    feed = {
+        'version': 'https://jsonfeed.org/version/1',
+        'title': index.title,
+        'home_page_url': index.full_url,
+        'feed_url': request.build_absolute_uri(),
+        'items': items,
+    }
+    return json.dumps(feed), last_modified
+
+def build_feed(index, request, feed_format):
+    if feed_format == 'json':
+        body, last_modified = generate_json_feed(index, request)
+    else:
+        body, last_modified = generate_syndication_feed(index, request, feed_format)
+    body = force_bytes(body)
+    return {
+        'body': body,
+        'etag': quote_etag(hashlib.md5(body).hexdigest()),
+        'last_modified': timestamp(last_modified) or None,
+    }
+
+
+def serve_feed(index, request, feed_format):
+    tag = request.GET.get('tag') if settings.USE_TAGS else None
+    cache = get_feed_cache()
+
+    key = _feed_key(index, feed_format, tag, request)
+    feed = cache.get(key)
+    if feed is None:
+        feed = build_feed(index, request, feed_format)
+        cache.set(key, feed, settings.FEED_CACHE_TIMEOUT)
+
+    if not_modified(request, feed['etag'], feed['last_modified']):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(feed['body'], content_type=FEED_FORMATS[feed_format])
+    response['ETag'] = feed['etag']
+    if feed['last_modified']:
+        response['Last-Modified'] = http_date(feed['last_modified'])
+    return response
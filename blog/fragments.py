@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+JSON endpoint behind AjaxBlogPage's infinite scroll, served at <ajax page url>/fragments/.
+
+Takes ?cursor= (a blog.pagination token, older or newer) and an optional ?tag= or
+?category= (slug) filter, and answers with one page of posts plus the cursors to continue
+in either direction:
+
+    {"posts": [{"id", "title", "url", "date", "html", "thumbnail", "tags", "category"}, ...],
+     "older": token or null, "newer": token or null}
+
+Post HTML comes from the render cache and thumbnails from the listing renditions, so a page
+costs a constant number of queries. Responses are validated and cached under the listing
+versions from blog.caching, like the index pages.
+"""
+from __future__ import unicode_literals
+
+import json
+
+from django.http import HttpResponse, Http404
+
+from blog import settings
+from blog.caching import get_index_version, get_tag_version, serve_cached, serve_conditionally
+from blog.feeds import post_html
+from blog.listing import prefetch_listing, prefetch_listing_page
+from blog.pagination import CursorPaginator, CURSOR_QUERYSTRING_KEY
+from blog.routing import get_page_path
+
+FRAGMENT_PATH = 'fragments'
+
+
+def get_fragment_posts(blog_path, tag=None, category=None):
+    """
+    Return (posts, version) for the blog at blog_path, filtered on a tag name or a category
+    slug, where version is the listing version that changes with the result.
+    """
+    from blog.models import BlogPost, POST_ORDERING, filter_posts_by_tag
+
+    posts = BlogPost.objects.live().filter(path__startswith=blog_path).exclude(path=blog_path).order_by(*POST_ORDERING)
+    if tag:
+        return filter_posts_by_tag(posts, tag), get_tag_version(blog_path, tag)
+    if category:
+        from blog.categories import get_category_tree
+        tree = get_category_tree()
+        node = next((node for node in tree.nodes
+                     if node.slug == category and node.live and node.path.startswith(blog_path)), None)
+        if node is None:
+            raise Http404
+        category_ids = tree.descendant_ids(node.id) if settings.INCLUDE_SUBCATEGORY_POSTS else [node.id]
+        return posts.filter(category_id__in=category_ids), get_index_version(node.path)
+    return posts, get_index_version(blog_path)
+
+def post_fragment(post, site):
+    fragment = {
+        'id': post.pk,
+        'title': post.title,
+        'url': post.relative_url(site),
+        'date': post.date.isoformat(),
+        'html': post_html(post),
+    }
+    if settings.USE_FEATURED_IMAGES:
+        rendition = post.featured_rendition
+        fragment['thumbnail'] = rendition and {
+            'url': rendition.url,
+            'width': rendition.width,
+            'height': rendition.height,
+            'alt': post.featured_image.title,
+        }
+    if settings.USE_TAGS:
+        fragment['tags'] = [tag.name for tag in post.listing_tags]
+    if settings.USE_CATEGORIES:
+        fragment['category'] = post.category.slug if post.category_id else None
+    return fragment
+
+def build_fragments(request, posts):
+    page = CursorPaginator(prefetch_listing(posts), settings.POSTS_PER_PAGE).page(request.GET.get(CURSOR_QUERYSTRING_KEY))
+    data = {
+        'posts': [post_fragment(post, request.site) for post in prefetch_listing_page(page)],
+        'older': page.next_cursor(),
+        'newer': page.previous_cursor(),
+    }
+    return json.dumps(data, separators=(',', ':'))
+
+
+def serve_fragments(ajax_page, request):
+    blog_path = get_page_path(ajax_page.blog_page_id) if ajax_page.blog_page_id else None
+    if blog_path is None:
+        raise Http404
+
+    tag = request.GET.get('tag') if settings.USE_TAGS else None
+    category = request.GET.get('category') if settings.USE_CATEGORIES else None
+    posts, (version, modified) = get_fragment_posts(blog_path, tag, category)
+
+    key_parts = (FRAGMENT_PATH, ajax_page.pk, blog_path, version, tag, category, request.GET.get(CURSOR_QUERYSTRING_KEY))
+    def respond():
+        return serve_cached(request, key_parts,
+                            lambda: HttpResponse(build_fragments(request, posts), content_type='application/json'))
+    return serve_conditionally(request, respond, key_parts, modified, settings.INDEX_CACHE_CONTROL)
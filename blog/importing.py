@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Importing posts from other blogs: JSON exports and WordPress WXR files.
+
+Both readers stream ImportedPost records. PostImporter adds them below a BlogType in
+chunks, each in its own transaction: the posts go in through bulk_add_pages, and missing
+categories, tags and tag rows are created in bulk. Records matching a post the blog already
+has (same date and title) are skipped, so an interrupted import can simply be run again.
+
+JSON exports are either a list of objects or one object per line (read line by line):
+
+    {"title": "...", "slug": "...", "date": "2016-01-31", "body": "<p>...</p>",
+     "tags": ["one", "two"], "category": ["Parent", "Child"]}
+
+slug is optional and category may also be a single title.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import operator
+import re
+from collections import namedtuple
+from datetime import datetime
+from functools import reduce
+from xml.etree.ElementTree import iterparse
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.html import strip_tags
+from django.utils.text import slugify
+
+from wagtail.wagtailcore.models import Page
+
+from blog import settings
+from blog.bulk import bulk_add_pages
+from blog.richtext import normalize_story_html
+
+try:
+    from html import unescape
+except ImportError: # Python 2
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
+
+ImportedPost = namedtuple('ImportedPost', ['title', 'slug', 'date', 'body', 'tags', 'category'])
+
+JSON = 'json'
+WXR = 'wxr'
+FORMATS = (JSON, WXR)
+
+CONTENT_NAMESPACE = '{http://purl.org/rss/1.0/modules/content/}'
+
+
+def parse_date(value):
+    # '2016-01-31', '2016-01-31 12:00:00' or ISO 8601
+    return datetime.strptime(value.strip()[:10], '%Y-%m-%d').date()
+
+def json_record(data):
+    category = data.get('category') or ()
+    if not isinstance(category, (list, tuple)):
+        category = (category,)
+    return ImportedPost(data['title'][:255], data.get('slug', ''), parse_date(data['date']), data.get('body') or data.get('content', ''),
+                        tuple(data.get('tags', ())), tuple(category))
+
+def read_json(stream):
+    first = stream.read(1)
+    while first.isspace():
+        first = stream.read(1)
+    if first == '[':
+        for data in json.loads(first + stream.read()):
+            yield json_record(data)
+        return
+    for line in stream:
+        line = (first + line).strip()
+        first = ''
+        if line:
+            yield json_record(json.loads(line))
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def read_wxr(stream):
+    """
+    Published posts of a WordPress export. A post keeps its first category, with the
+    category's parents from the export's category list. Processed elements are dropped from
+    the channel, so memory does not grow with the export.
+    """
+    parents = {} # nicename: (name, parent nicename)
+    channel = None
+    for event, element in iterparse(stream, events=('start', 'end')):
+        name = _local(element.tag)
+        if event == 'start':
+            if channel is None and name == 'channel':
+                channel = element
+            continue
+        if name == 'category' and element.tag != 'category' and element.find('*') is not None:
+            # channel level <wp:category>
+            fields = dict((_local(child.tag), child.text or '') for child in element)
+            parents[fields.get('category_nicename', '')] = (fields.get('cat_name', ''), fields.get('category_parent', ''))
+            if channel is not None:
+                channel.clear()
+        elif name == 'item':
+            fields = {}
+            tags = []
+            categories = []
+            for child in element:
+                child_name = _local(child.tag)
+                if child_name == 'category':
+                    if child.get('domain') == 'post_tag':
+                        tags.append(child.text or '')
+                    elif child.get('domain') == 'category':
+                        categories.append(child.get('nicename', ''))
+                elif child_name == 'encoded' and child.tag.startswith(CONTENT_NAMESPACE):
+                    fields['body'] = child.text or ''
+                elif child_name != 'encoded':
+                    fields[child_name] = child.text or ''
+            if channel is not None:
+                channel.clear()
+            if fields.get('post_type') != 'post' or fields.get('status') != 'publish':
+                continue
+            chain = []
+            nicename = categories[0] if categories else ''
+            while nicename and nicename in parents and len(chain) < 20:
+                chain.insert(0, parents[nicename][0])
+                nicename = parents[nicename][1]
+            yield ImportedPost(fields.get('title', '')[:255], fields.get('post_name', ''), parse_date(fields['post_date']),
+                               fields.get('body', ''), tuple(tags), tuple(chain))
+
+def read_posts(path, format=None):
+    format = format or (WXR if path.endswith(('.xml', '.wxr')) else JSON)
+    if format == WXR:
+        with open(path, 'rb') as stream:
+            for post in read_wxr(stream):
+                yield post
+    else:
+        with io.open(path, encoding='utf-8') as stream:
+            for post in read_json(stream):
+                yield post
+
+
+BLANK_LINE = re.compile(r'\n\s*\n')
+PARAGRAPH_TAG = re.compile(r'<p[\s>]', re.I)
+STORY_SPLIT = re.compile(r'<(h[234]|iframe|script|object)\b[^>]*>(.*?)</\1\s*>', re.I | re.S)
+
+def story_html(html):
+    """
+    Paragraph-level HTML as StoryTextArea would save it. Exports without <p> tags separate
+    paragraphs with blank lines.
+    """
+    if not PARAGRAPH_TAG.search(html):
+        html = BLANK_LINE.sub('<br/>', html.strip())
+    return normalize_story_html(html)
+
+def story_blocks(html):
+    """
+    StoryBlock stream data for an HTML body: headings become heading blocks, embedded
+    players and scripts raw HTML blocks, and everything between them paragraph blocks.
+    """
+    blocks = []
+
+    def paragraph(html):
+        html = story_html(html)
+        if html:
+            blocks.append({'type': 'paragraph', 'value': html})
+
+    position = 0
+    for match in STORY_SPLIT.finditer(html):
+        paragraph(html[position:match.start()])
+        tag = match.group(1).lower()
+        if tag.startswith('h'):
+            text = unescape(strip_tags(match.group(2))).strip()
+            if text:
+                blocks.append({'type': tag, 'value': text})
+        else:
+            blocks.append({'type': 'raw_html', 'value': match.group(0)})
+        position = match.end()
+    paragraph(html[position:])
+    return blocks
+
+def convert_body(html):
+    if settings.USE_STREAMFIELD:
+        return json.dumps(story_blocks(html))
+    return story_html(html)
+
+
+def unique_slug(text, taken, fallback='post'):
+    base = slugify(text)[:240] or fallback
+    slug = base
+    n = 1
+    while slug in taken:
+        n += 1
+        slug = '%s-%d' % (base, n)
+    taken.add(slug)
+    return slug
+
+
+class PostImporter(object):
+    """
+    Adds ImportedPost records below a BlogType, one chunk per import_chunk call.
+    """
+    def __init__(self, blog):
+        from blog.models import BlogPost
+
+        self.blog = blog
+        self.slugs = set(Page.objects.child_of(blog).values_list('slug', flat=True))
+        self.existing = set(BlogPost.objects.child_of(blog).values_list('date', 'title'))
+        self.categories = {} # (parent path, title): BlogCategory
+        if settings.USE_CATEGORIES:
+            from blog.models import BlogCategory
+            for category in BlogCategory.objects.descendant_of(blog):
+                self.categories[(category.path[:-Page.steplen], category.title)] = category
+        self.tag_names = set()
+        self.category_ids = set()
+        self.last_post = None
+
+    def get_categories(self, chains):
+        """
+        {chain: BlogCategory} for title chains, creating missing categories level by level.
+        """
+        from blog.models import BlogCategory
+
+        found = {}
+        for level in range(max(len(chain) for chain in chains) if chains else 0):
+            missing = {} # parent: [titles]
+            for chain in chains:
+                if len(chain) <= level:
+                    continue
+                parent = found[chain[:level]] if level else self.blog
+                if (parent.path, chain[level]) not in self.categories:
+                    titles = missing.setdefault(parent.path, (parent, []))[1]
+                    if chain[level] not in titles:
+                        titles.append(chain[level])
+            for parent, titles in missing.values():
+                taken = self.slugs if parent is self.blog else set(Page.objects.child_of(parent).values_list('slug', flat=True))
+                new = bulk_add_pages(parent, [BlogCategory(title=title, slug=unique_slug(title, taken, 'category')) for title in titles])
+                self.categories.update(((parent.path, category.title), category) for category in new)
+            for chain in chains:
+                if len(chain) > level:
+                    parent = found[chain[:level]] if level else self.blog
+                    found[chain[:level + 1]] = self.categories[(parent.path, chain[level])]
+        return found
+
+    def get_tag_ids(self, names):
+        from taggit.models import Tag
+
+        tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+        missing = [name for name in names if name not in tag_ids]
+        if missing:
+            # numbered variants such as foo-2 may exist as well
+            candidates = set(slugify(name)[:240] or 'tag' for name in missing)
+            prefixes = reduce(operator.or_, [Q(slug__startswith=candidate) for candidate in candidates])
+            taken = set(Tag.objects.filter(prefixes).values_list('slug', flat=True))
+            Tag.objects.bulk_create([Tag(name=name, slug=unique_slug(name, taken, 'tag')) for name in missing])
+            tag_ids.update(Tag.objects.filter(name__in=missing).values_list('name', 'pk'))
+        return tag_ids
+
+    @transaction.atomic
+    def import_chunk(self, records):
+        """
+        Import a chunk of records; returns (imported, skipped).
+        """
+        from blog.models import BlogPost
+
+        new = []
+        for record in records:
+            if (record.date, record.title) in self.existing:
+                continue
+            self.existing.add((record.date, record.title))
+            new.append(record)
+        if not new:
+            return 0, len(records)
+
+        categories = {}
+        if settings.USE_CATEGORIES:
+            categories = self.get_categories(set(tuple(record.category) for record in new if record.category))
+        posts = []
+        for record in new:
+            post = BlogPost(title=record.title, slug=unique_slug(record.slug or record.title, self.slugs), date=record.date,
+                            content=convert_body(record.body))
+            if record.category in categories:
+                post.category = categories[record.category]
+                self.category_ids.add(post.category.pk)
+            posts.append(post)
+        bulk_add_pages(self.blog, posts)
+        self.last_post = posts[-1]
+
+        if settings.USE_TAGS:
+            from blog.models import BlogPostTag
+            names = set(name.strip() for record in new for name in record.tags if name.strip())
+            tag_ids = self.get_tag_ids(names) if names else {}
+            self.tag_names.update(names)
+            BlogPostTag.objects.bulk_create([
+                BlogPostTag(content_object_id=post.pk, tag_id=tag_ids[name])
+                for post, record in zip(posts, new) for name in set(name.strip() for name in record.tags if name.strip())
+            ])
+        return len(new), len(records) - len(new)
+
+    def finish(self):
+        """
+        Drop the caches the import made stale and recount the archive months. The other
+        derived tables are rebuilt separately.
+        """
+        from blog.archives import rebuild_month_counts
+        from blog.caching import bump_index_versions
+        from blog.categories import invalidate_category_tree
+        from blog.routing import clear_page_paths, invalidate_routes
+
+        clear_page_paths()
+        rebuild_month_counts(self.blog)
+        if settings.USE_CATEGORIES:
+            invalidate_category_tree()
+        if settings.ROUTE_CACHE_ALIAS:
+            invalidate_routes(self.blog)
+        if self.last_post is not None:
+            bump_index_versions(self.last_post, self.tag_names, self.category_ids)
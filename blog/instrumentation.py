@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Optional timers and query counters for the blog's hot paths, enabled with the INSTRUMENTATION
+setting and InstrumentationMiddleware.
+
+Methods decorated with @timed('name') add their duration and query count to the current
+request's measurements. The middleware turns those into a Server-Timing header and a
+structured log line on the 'blog.instrumentation' logger, and adds them to rolling samples in
+the INSTRUMENTATION_CACHE_ALIAS cache that the admin report shows as percentiles.
+
+With INSTRUMENTATION off, @timed returns the function unchanged, so the only cost is at
+import time.
+"""
+from __future__ import unicode_literals
+
+import json
+import logging
+import threading
+import time
+from functools import wraps
+
+from django.core.cache import caches
+from django.db import connection
+
+from blog import settings
+
+logger = logging.getLogger('blog.instrumentation')
+
+_state = threading.local()
+
+SAMPLES_KEY = 'blog:instrumentation:%s'
+NAMES_KEY = 'blog:instrumentation:names'
+
+
+def _query_count():
+    return len(connection.queries_log)
+
+def timed(name):
+    def decorator(func):
+        if not settings.INSTRUMENTATION:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            measurements = getattr(_state, 'measurements', None)
+            if measurements is None:
+                return func(*args, **kwargs)
+            queries = _query_count()
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                measurements.append((name, time.time() - start, _query_count() - queries))
+        return wrapper
+    return decorator
+
+
+def start_collecting():
+    _state.measurements = []
+    _state.debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True # queries_log is only filled with a debug cursor
+
+def stop_collecting():
+    """
+    Return {name: (count, seconds, queries)} for the calls measured since start_collecting.
+    Nested timers each count their own full duration.
+    """
+    measurements = getattr(_state, 'measurements', None) or []
+    _state.measurements = None
+    connection.force_debug_cursor = getattr(_state, 'debug_cursor', False)
+    totals = {}
+    for name, seconds, queries in measurements:
+        count, total_seconds, total_queries = totals.get(name, (0, 0.0, 0))
+        totals[name] = (count + 1, total_seconds + seconds, total_queries + queries)
+    return totals
+
+
+def server_timing(totals):
+    return ', '.join('blog-%s;dur=%.2f;desc="%d calls, %d queries"' % (name, seconds * 1000, count, queries)
+                     for name, (count, seconds, queries) in sorted(totals.items()))
+
+def record_samples(totals):
+    """
+    Append this request's totals to the rolling samples, keeping the last
+    INSTRUMENTATION_SAMPLES per name. Concurrent requests may drop each other's samples.
+    """
+    if not totals:
+        return
+    cache = caches[settings.INSTRUMENTATION_CACHE_ALIAS]
+    keys = [SAMPLES_KEY % name for name in totals]
+    stored = cache.get_many(keys + [NAMES_KEY])
+    names = set(stored.get(NAMES_KEY, ())) | set(totals)
+    updates = {NAMES_KEY: sorted(names)}
+    for name, (count, seconds, queries) in totals.items():
+        samples = stored.get(SAMPLES_KEY % name, [])
+        samples.append((seconds, queries))
+        updates[SAMPLES_KEY % name] = samples[-settings.INSTRUMENTATION_SAMPLES:]
+    cache.set_many(updates, None)
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def sample_report():
+    """
+    [(name, samples, p50 ms, p90 ms, p99 ms, mean queries)] over the stored samples.
+    """
+    cache = caches[settings.INSTRUMENTATION_CACHE_ALIAS]
+    names = cache.get(NAMES_KEY, [])
+    stored = cache.get_many([SAMPLES_KEY % name for name in names])
+    report = []
+    for name in names:
+        samples = stored.get(SAMPLES_KEY % name)
+        if not samples:
+            continue
+        durations = sorted(seconds * 1000 for seconds, queries in samples)
+        report.append((name, len(samples), percentile(durations, 0.5), percentile(durations, 0.9), percentile(durations, 0.99),
+                       sum(queries for seconds, queries in samples) / float(len(samples))))
+    return report
+
+
+class InstrumentationMiddleware(object):
+    """
+    Add to MIDDLEWARE_CLASSES to collect measurements for every request.
+    """
+    def process_request(self, request):
+        if settings.INSTRUMENTATION:
+            start_collecting()
+
+    def process_response(self, request, response):
+        if not settings.INSTRUMENTATION or getattr(_state, 'measurements', None) is None:
+            return response
+        totals = stop_collecting()
+        if totals:
+            response['Server-Timing'] = server_timing(totals)
+            logger.info(json.dumps({
+                'path': request.path,
+                'status': response.status_code,
+                'timings': dict((name, {'calls': count, 'ms': round(seconds * 1000, 2), 'queries': queries})
+                                for name, (count, seconds, queries) in totals.items()),
+            }, sort_keys=True))
+            record_samples(totals)
+        return response
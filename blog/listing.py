@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Helpers that keep post listings (index, category and tag pages) at a constant number of
+queries regardless of POSTS_PER_PAGE.
+"""
+from __future__ import unicode_literals
+
+from blog import settings
+from blog.renditions import find_renditions
+
+from wagtail.wagtailimages.models import SourceImageIOError
+
+
+def prefetch_listing(posts):
+    """
+    Join or prefetch everything blog_index.html touches for each post.
+    """
+    related = []
+    if settings.USE_CATEGORIES:
+        related.append('category')
+    if settings.USE_FEATURED_IMAGES:
+        related.append('featured_image')
+    if related:
+        posts = posts.select_related(*related)
+    return posts
+
+def prefetch_listing_page(posts):
+    """
+    Bulk-load the per-post data of an already paginated page: featured image renditions
+    and tags (as post.listing_tags).
+    """
+    posts = list(posts)
+    prefetch_listing_renditions(posts)
+    if settings.USE_TAGS:
+        prefetch_listing_tags(posts)
+    return posts
+
+def prefetch_listing_tags(posts):
+    from blog.models import BlogPostTag
+
+    tags = dict((post.pk, []) for post in posts)
+    if tags:
+        for item in BlogPostTag.objects.filter(content_object_id__in=list(tags.keys())).select_related('tag').order_by('tag__name'):
+            tags[item.content_object_id].append(item.tag)
+    for post in posts:
+        post.listing_tags = tags[post.pk]
+    return posts
+
+def prefetch_listing_renditions(posts, filter_spec=None):
+    """
+    Set post.featured_rendition on every post, fetching the existing renditions in one
+    query. Missing renditions are generated one by one, which only happens the first time
+    a page is viewed.
+    """
+    if not settings.USE_FEATURED_IMAGES:
+        return posts
+    filter_spec = filter_spec or settings.LISTING_IMAGE_FILTER
+
+    posts = list(posts)
+    images = dict((post.featured_image_id, post.featured_image) for post in posts if post.featured_image_id)
+    renditions = find_renditions(images, [(image_id, filter_spec) for image_id in images])
+
+    for post in posts:
+        rendition = None
+        if post.featured_image_id:
+            rendition = renditions.get((post.featured_image_id, filter_spec))
+            if rendition is None:
+                try:
+                    rendition = post.featured_image.get_rendition(filter_spec)
+                except SourceImageIOError:
+                    rendition = None
+            if rendition is not None:
+                # rendition.alt reads the image title; reuse the select_related image
+                rendition.image = post.featured_image
+        post.featured_rendition = rendition
+    return posts
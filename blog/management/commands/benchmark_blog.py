@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blog.benchmark import generate_blog, forget_blog, run_benchmarks, story_html_benchmark
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic blog and report latency and query counts of the main blog views against their budgets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000,
+            help="Number of posts to generate.")
+        parser.add_argument('--repeat', type=int, default=20,
+            help="Timed runs per view.")
+        parser.add_argument('--keep', action='store_true', default=False,
+            help="Keep the generated pages instead of rolling them back.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                start = time.time()
+                data = generate_blog(posts=options['posts'])
+                elapsed = time.time() - start
+                self.stdout.write("Generated %d posts in %.1fs (%.1f/s)." % (options['posts'], elapsed, options['posts'] / elapsed if elapsed else 0))
+
+                results = run_benchmarks(data, options['repeat'])
+                if not options['keep']:
+                    forget_blog(data)
+                    raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write("%-24s %10s %10s %8s %8s" % ('path', 'median ms', 'p95 ms', 'queries', 'budget'))
+        over = []
+        for name, timings, queries, budget in results:
+            median = timings[len(timings) // 2] * 1000
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000
+            self.stdout.write("%-24s %10.2f %10.2f %8d %8d" % (name, median, p95, queries, budget))
+            if queries > budget:
+                over.append(name)
+
+        self.stdout.write("\n%-24s %10s %10s  (one StoryTextArea save)" % ('rich text cleanup', 'median ms', 'p95 ms'))
+        for name, timings in story_html_benchmark(options['repeat']):
+            median = timings[len(timings) // 2] * 1000
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000
+            self.stdout.write("%-24s %10.2f %10.2f" % (name, median, p95))
+        if over:
+            raise CommandError("Over query budget: %s" % ', '.join(over))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+from functools import partial
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from blog.export import load_manifest, save_manifest, plan_export, render_task, remove_dirs, clear_output
+
+
+class Command(BaseCommand):
+    help = "Render the live blog to static HTML files, re-rendering only what changed since the last export."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir',
+            help="Directory the site is written to; it mirrors the page URLs.")
+        parser.add_argument('--processes', type=int, default=None,
+            help="Worker processes (defaults to the number of CPUs).")
+        parser.add_argument('--full', action='store_true', default=False,
+            help="Clear the output directory and render every page.")
+
+    def handle(self, *args, **options):
+        output_dir = os.path.abspath(options['output_dir'])
+        start = time.time()
+
+        if options['full']:
+            clear_output(output_dir)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        tasks, stale_dirs, manifest = plan_export(load_manifest(output_dir), full=options['full'])
+        remove_dirs(output_dir, stale_dirs)
+        self.stdout.write("%d pages to render, %d removed." % (len(tasks), len(stale_dirs)))
+
+        written = 0
+        if tasks:
+            # forked workers must not share the parent's database connection
+            for connection in connections.all():
+                connection.close()
+            pool = Pool(options['processes'])
+            try:
+                written = sum(pool.imap_unordered(partial(render_task, output_dir), tasks, chunksize=10))
+            finally:
+                pool.close()
+                pool.join()
+        save_manifest(output_dir, manifest)
+
+        elapsed = time.time() - start
+        self.stdout.write("Rendered %d pages (%.1f MB) in %.1fs (%.1f pages/s)." % (
+            len(tasks), written / 1048576.0, elapsed, len(tasks) / elapsed if elapsed else 0))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+from itertools import islice
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import settings
+from blog.importing import PostImporter, read_posts, FORMATS
+from blog.models import BlogType
+
+
+class Command(BaseCommand):
+    help = "Import posts from a JSON or WordPress WXR export below a blog. Safe to run again after an interruption."
+
+    def add_arguments(self, parser):
+        parser.add_argument('blog_id', type=int,
+            help="Primary key of the BlogType page to import into.")
+        parser.add_argument('path',
+            help="Export file; .xml and .wxr files are read as WXR, anything else as JSON.")
+        parser.add_argument('--format', choices=FORMATS, default=None,
+            help="Override the format guessed from the file name.")
+        parser.add_argument('--chunk-size', type=int, default=500,
+            help="Number of posts inserted and committed per batch.")
+        parser.add_argument('--no-rebuild', action='store_false', dest='rebuild', default=True,
+            help="Skip rebuilding the derived blog tables, e.g. when more imports follow.")
+
+    def handle(self, *args, **options):
+        try:
+            blog = BlogType.objects.get(pk=options['blog_id'])
+        except BlogType.DoesNotExist:
+            raise CommandError("No blog with id %d." % options['blog_id'])
+
+        chunk_size = options['chunk_size']
+        importer = PostImporter(blog)
+        records = read_posts(options['path'], options['format'])
+        imported = skipped = 0
+        start = time.time()
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            added, already = importer.import_chunk(chunk)
+            imported += added
+            skipped += already
+            elapsed = time.time() - start
+            self.stdout.write("%d posts imported, %d already present (%.1f posts/s)." % (imported, skipped, imported / elapsed if elapsed else 0))
+        importer.finish()
+        elapsed = time.time() - start
+        self.stdout.write("Imported %d posts in %.1fs (%.1f posts/s)." % (imported, elapsed, imported / elapsed if elapsed else 0))
+
+        # what publishing would have stored
+        if options['rebuild'] and imported:
+            if settings.EXPAND_RICH_TEXT_ON_PUBLISH:
+                call_command('rebuild_blog_expanded_text', stdout=self.stdout)
+            call_command('rebuild_blog_taxonomy', stdout=self.stdout)
+            if settings.USE_LISTING_TABLE:
+                call_command('rebuild_blog_listing', stdout=self.stdout)
+            if settings.USE_SEARCH:
+                call_command('rebuild_blog_search', stdout=self.stdout)
+            if settings.USE_RELATED_POSTS:
+                call_command('rebuild_blog_related', stdout=self.stdout)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from blog.models import BlogPost
+from blog.renditions import post_rendition_specs, missing_rendition_specs, generate_renditions
+
+
+def generate_chunk(specs):
+    # runs in a worker process
+    return generate_renditions(specs)
+
+
+class Command(BaseCommand):
+    help = "Generate the renditions every live blog post needs, skipping existing ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+            help="Worker processes (defaults to the number of CPUs).")
+        parser.add_argument('--chunk-size', type=int, default=500,
+            help="Number of posts scanned per batch.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        start = time.time()
+
+        specs = set()
+        posts = BlogPost.objects.live().order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(posts.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            chunk_specs = set()
+            for post in chunk:
+                chunk_specs |= post_rendition_specs(post)
+            specs |= missing_rendition_specs(chunk_specs)
+            last_pk = chunk[-1].pk
+
+        specs = sorted(specs)
+        self.stdout.write("%d renditions to generate." % len(specs))
+        if not specs:
+            return
+
+        # forked workers must not share the parent's database connection
+        for connection in connections.all():
+            connection.close()
+        pool = Pool(options['processes'])
+        try:
+            batches = [specs[i:i + 20] for i in range(0, len(specs), 20)]
+            generated = sum(pool.imap_unordered(generate_chunk, batches))
+        finally:
+            pool.close()
+            pool.join()
+
+        elapsed = time.time() - start
+        self.stdout.write("Generated %d renditions in %.1fs (%.1f/s)." % (generated, elapsed, generated / elapsed if elapsed else 0))
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.archives import rebuild_month_counts
+from blog.models import BlogType, BlogArchiveCount
+
+
+class Command(BaseCommand):
+    help = "Recount the live posts per month behind the archive sidebar of every blog."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            BlogArchiveCount.objects.all().delete()
+            for blog in BlogType.objects.all():
+                self.stdout.write("%s: %d months." % (blog.title, rebuild_month_counts(blog)))
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from blog.expansion import expand_posts
+from blog.models import BlogPost
+
+
+class Command(BaseCommand):
+    help = "Expand and store the rich text links and embeds of all live blog posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200,
+            help="Number of posts expanded per batch; references are resolved per batch.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        count = 0
+        posts = BlogPost.objects.live().order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(posts.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            expand_posts(chunk)
+            last_pk = chunk[-1].pk
+            count += len(chunk)
+
+        self.stdout.write("Expanded rich text of %d posts." % count)
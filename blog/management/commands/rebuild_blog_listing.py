@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.listing import prefetch_listing
+from blog.models import BlogPost, BlogPostListing
+
+
+class Command(BaseCommand):
+    help = "Rebuild the BlogPostListing table from all live blog posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+            help="Number of posts loaded and inserted per batch.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        count = 0
+        with transaction.atomic():
+            BlogPostListing.objects.all().delete()
+
+            posts = prefetch_listing(BlogPost.objects.live().order_by('pk'))
+            last_pk = 0
+            while True:
+                chunk = list(posts.filter(pk__gt=last_pk)[:chunk_size])
+                if not chunk:
+                    break
+                BlogPostListing.objects.bulk_create([BlogPostListing.from_post(post) for post in chunk])
+                last_pk = chunk[-1].pk
+                count += len(chunk)
+
+        self.stdout.write("Rebuilt listings for %d posts." % count)
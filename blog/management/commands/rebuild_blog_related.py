@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.models import BlogType, BlogRelatedPost
+from blog.related import rebuild_related
+
+
+class Command(BaseCommand):
+    help = "Recompute the related posts of all live blog posts from their tags and categories."
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = 0
+        with transaction.atomic():
+            BlogRelatedPost.objects.all().delete()
+            for blog in BlogType.objects.all():
+                posts = rebuild_related(blog)
+                count += posts
+                self.stdout.write("%s: related posts of %d posts." % (blog.title, posts))
+        elapsed = time.time() - start
+        self.stdout.write("Related posts of %d posts in %.1fs (%.1f posts/s)." % (count, elapsed, count / elapsed if elapsed else 0))
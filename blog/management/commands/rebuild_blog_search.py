@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.listing import prefetch_listing
+from blog.models import BlogType, BlogPost, BlogSearchDocument
+from blog.search import index_posts, unindex_posts
+
+
+class Command(BaseCommand):
+    help = "Rebuild the blog search index, streaming live posts in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200,
+            help="Number of posts loaded and indexed per batch.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        start = time.time()
+
+        # reindex in place and only then drop what is left over, so search keeps working
+        # while the command runs
+        indexed = set()
+        for blog in BlogType.objects.all():
+            posts = prefetch_listing(BlogPost.objects.descendant_of(blog).live().order_by('pk'))
+            last_pk = 0
+            while True:
+                chunk = list(posts.filter(pk__gt=last_pk)[:chunk_size])
+                if not chunk:
+                    break
+                index_posts(chunk, blog.pk)
+                last_pk = chunk[-1].pk
+                indexed.update(post.pk for post in chunk)
+
+        stale = [post_id for post_id in BlogSearchDocument.objects.values_list('post_id', flat=True) if post_id not in indexed]
+        for i in range(0, len(stale), chunk_size):
+            unindex_posts(stale[i:i + chunk_size])
+
+        elapsed = time.time() - start
+        self.stdout.write("Indexed %d posts and removed %d stale documents in %.1fs." % (len(indexed), len(stale), elapsed))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.listing import prefetch_listing
+from blog.models import BlogType, BlogPost, BlogTaxonomyIndex, BlogTaxonomyCount
+from blog.taxonomy import post_taxonomy
+
+
+class Command(BaseCommand):
+    help = "Rebuild the tag and category index and counts from all live blog posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+            help="Number of posts loaded and inserted per batch.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        with transaction.atomic():
+            BlogTaxonomyIndex.objects.all().delete()
+            BlogTaxonomyCount.objects.all().delete()
+
+            for blog in BlogType.objects.all():
+                counts = Counter()
+                names = {}
+                posts = prefetch_listing(BlogPost.objects.descendant_of(blog).live().order_by('pk'))
+                last_pk = 0
+                while True:
+                    chunk = list(posts.filter(pk__gt=last_pk)[:chunk_size])
+                    if not chunk:
+                        break
+                    rows = []
+                    for post in chunk:
+                        for (kind, key), name in post_taxonomy(post).items():
+                            rows.append(BlogTaxonomyIndex(post_id=post.pk, blog_id=blog.pk, kind=kind, key=key, name=name, date=post.date))
+                            counts[(kind, key)] += 1
+                            names[(kind, key)] = name
+                    BlogTaxonomyIndex.objects.bulk_create(rows)
+                    last_pk = chunk[-1].pk
+
+                BlogTaxonomyCount.objects.bulk_create([
+                    BlogTaxonomyCount(blog_id=blog.pk, kind=kind, key=key, name=names[(kind, key)], count=count)
+                    for (kind, key), count in counts.items()
+                ])
+                self.stdout.write("%s: %d tags and categories." % (blog.title, len(counts)))
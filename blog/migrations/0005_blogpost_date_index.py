@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import datetime
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_ajaxblogpage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogpost',
+            name='date',
+            field=models.DateField(default=datetime.datetime.now, help_text='The date used while organizing the posts', db_index=True),
+            preserve_default=True,
+        ),
+    ]
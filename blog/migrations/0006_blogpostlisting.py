@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_blogpost_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogPostListing',
+            fields=[
+                ('post', models.OneToOneField(related_name='listing', primary_key=True, serialize=False, to='blog.BlogPost', on_delete=django.db.models.deletion.CASCADE)),
+                ('path', models.CharField(max_length=255, db_index=True)),
+                ('url_path', models.TextField()),
+                ('title', models.CharField(max_length=255)),
+                ('date', models.DateField(db_index=True)),
+                ('category_id', models.IntegerField(db_index=True, null=True, blank=True)),
+                ('tag_names', models.TextField(blank=True)),
+                ('excerpt', models.TextField(blank=True)),
+                ('thumbnail_url', models.CharField(max_length=255, blank=True)),
+                ('thumbnail_width', models.IntegerField(null=True, blank=True)),
+                ('thumbnail_height', models.IntegerField(null=True, blank=True)),
+                ('thumbnail_alt', models.CharField(max_length=255, blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='blogpostlisting',
+            index_together=set([('date', 'post')]),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_blogpostlisting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogTaxonomyCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('blog_id', models.IntegerField()),
+                ('kind', models.CharField(max_length=10, choices=[('tag', 'Tag'), ('category', 'Category')])),
+                ('key', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=255)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='blogtaxonomycount',
+            unique_together=set([('blog_id', 'kind', 'key')]),
+        ),
+        migrations.CreateModel(
+            name='BlogTaxonomyIndex',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('post', models.ForeignKey(related_name='taxonomy_index', to='blog.BlogPost', on_delete=django.db.models.deletion.CASCADE)),
+                ('blog_id', models.IntegerField(db_index=True)),
+                ('kind', models.CharField(max_length=10, choices=[('tag', 'Tag'), ('category', 'Category')])),
+                ('key', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=255)),
+                ('date', models.DateField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='blogtaxonomyindex',
+            unique_together=set([('post', 'kind', 'key')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='blogtaxonomyindex',
+            index_together=set([('kind', 'name', 'date'), ('kind', 'key', 'date')]),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations, DatabaseError
+import django.db.models.deletion
+
+
+def create_fulltext(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("ALTER TABLE blog_blogsearchdocument ADD COLUMN search_vector tsvector")
+        schema_editor.execute("CREATE INDEX blog_blogsearchdocument_search_vector ON blog_blogsearchdocument USING gin(search_vector)")
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute("CREATE VIRTUAL TABLE blog_search_fts USING fts5(title, body, tags, category)")
+        except DatabaseError:
+            pass # SQLite built without FTS5; blog.search falls back to LIKE matching
+
+
+def drop_fulltext(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("ALTER TABLE blog_blogsearchdocument DROP COLUMN search_vector")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS blog_search_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_taxonomy_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogSearchDocument',
+            fields=[
+                ('post', models.OneToOneField(related_name='search_document', primary_key=True, serialize=False, to='blog.BlogPost', on_delete=django.db.models.deletion.CASCADE)),
+                ('blog_id', models.IntegerField(db_index=True)),
+                ('category_id', models.IntegerField(db_index=True, null=True, blank=True)),
+                ('date', models.DateField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('tags', models.TextField(blank=True)),
+                ('category', models.CharField(max_length=255, blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunPython(create_fulltext, drop_fulltext),
+    ]
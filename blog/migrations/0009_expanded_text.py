@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0010_change_page_owner_to_null_on_delete'),
+        ('blog', '0008_blogsearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogExpandedText',
+            fields=[
+                ('post', models.OneToOneField(related_name='expanded_text', primary_key=True, serialize=False, to='blog.BlogPost', on_delete=django.db.models.deletion.CASCADE)),
+                ('html', models.TextField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='BlogExpandedTextLink',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('post', models.ForeignKey(related_name='expanded_links', to='blog.BlogPost', on_delete=django.db.models.deletion.CASCADE)),
+                ('page', models.ForeignKey(related_name='+', to='wagtailcore.Page', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING)),
+                ('url_path', models.TextField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
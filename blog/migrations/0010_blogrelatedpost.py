@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_expanded_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogRelatedPost',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('post', models.ForeignKey(related_name='related_posts', to='blog.BlogPost', on_delete=django.db.models.deletion.CASCADE)),
+                ('related', models.ForeignKey(related_name='related_to', to='blog.BlogPost', on_delete=django.db.models.deletion.CASCADE)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='blogrelatedpost',
+            unique_together=set([('post', 'rank')]),
+        ),
+    ]
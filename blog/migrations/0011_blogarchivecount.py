@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from django.db import models, migrations
+from django.db.models import Count
+
+
+def count_months(apps, schema_editor):
+    BlogType = apps.get_model('blog', 'BlogType')
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    BlogArchiveCount = apps.get_model('blog', 'BlogArchiveCount')
+    for blog_id, path in BlogType.objects.values_list('pk', 'path'):
+        counts = Counter()
+        days = (BlogPost.objects.filter(live=True, path__startswith=path).exclude(path=path)
+                .order_by().values_list('date').annotate(count=Count('pk')))
+        for day, count in days:
+            counts[(day.year, day.month)] += count
+        BlogArchiveCount.objects.bulk_create([BlogArchiveCount(blog_id=blog_id, year=year, month=month, count=count)
+                                              for (year, month), count in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_blogrelatedpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogArchiveCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('blog_id', models.IntegerField()),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='blogarchivecount',
+            unique_together=set([('blog_id', 'year', 'month')]),
+        ),
+        migrations.RunPython(count_months, migrations.RunPython.noop),
+    ]
@@ -4,8 +4,16 @@ from django.db import models
 from django.conf import settings as site_settings
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils.translation import ugettext, ugettext_lazy as _
-from django.http import QueryDict
+from django.http import QueryDict, Http404
 from django.utils.safestring import mark_safe
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+try:
+    from html import unescape
+except ImportError: # Python 2
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
 
 from django.contrib.contenttypes.models import ContentType
 
@@ -15,11 +23,21 @@ from wagtail.wagtailcore.models import Page
 from wagtail.wagtailcore.url_routing import RouteResult
 from wagtail.wagtailcore.fields import RichTextField, StreamField
 
+from .archives import parse_archive_path
 from .blocks import StoryBlock
+from .expansion import render_post_content
+from .instrumentation import timed
+from .caching import render_content, get_index_version, get_listing_version, serve_conditionally, serve_cached, timestamp
+from .categories import get_category_tree
+from .feeds import parse_feed_path, serve_feed
+from .fragments import serve_fragments, FRAGMENT_PATH
+from .listing import prefetch_listing, prefetch_listing_page
+from .routing import resolve_route, get_page_path, relative_url_for_path
+from .pagination import CursorPaginator, CURSOR_QUERYSTRING_KEY, AT, older_than, newer_than, encode_position
 
 from wagtail.wagtailadmin.edit_handlers import FieldPanel, PageChooserPanel
 from wagtail.wagtailimages.edit_handlers import ImageChooserPanel
-from wagtail.wagtailimages.models import Image
+from wagtail.wagtailimages.models import Image, SourceImageIOError
 
 from modelcluster.fields import ParentalKey
 from modelcluster.tags import ClusterTaggableManager
@@ -35,6 +53,10 @@ except ImportError:
 
 CONTEXT_POST_QUERYSTRING_KEY = 'post_url_querystring'
 CONTEXT_PAGE_QUERYSTRING_KEY = 'page_url_querystring'
+SEARCH_QUERYSTRING_KEY = 'q'
+
+# newest first; pk breaks ties between posts sharing a date
+POST_ORDERING = ('-date', '-pk')
 
 if settings.USE_TAGS:
     class BlogPostTag(TaggedItemBase):
@@ -51,8 +73,13 @@ def update_context_querystring(context,context_key,first_arg=True,**kwargs):
         context[context_key] = mark_safe(lead_char + query.urlencode())
     return context
 
+def filter_posts_by_tag(posts, tag):
+    if settings.USE_TAXONOMY_INDEX:
+        return posts.filter(taxonomy_index__kind=TAXONOMY_TAG, taxonomy_index__name=tag)
+    return posts.filter(tags__name=tag)
+
 class BlogPost(Page):
-    date = models.DateField(help_text="The date used while organizing the posts",default=datetime.now())
+    date = models.DateField(help_text="The date used while organizing the posts",default=datetime.now(),db_index=True)
     if 'wagtail.contrib.wagtailapi' in site_settings.INSTALLED_APPS:
         api_fields = ('date',)
 
@@ -61,7 +88,7 @@ class BlogPost(Page):
 
         @property
         def rendered_content(self):
-            return self.content.__str__()
+            return render_content(self)
 
         if 'wagtail.contrib.wagtailapi' in site_settings.INSTALLED_APPS:
             api_fields += ('rendered_content',)
@@ -70,6 +97,10 @@ class BlogPost(Page):
     else:
         content = RichTextField(blank=True)
 
+        @property
+        def rendered_content(self):
+            return mark_safe(render_post_content(self))
+
     if settings.USE_FEATURED_IMAGES:
         featured_image = models.ForeignKey(Image, related_name='+', blank=True, null=True, on_delete=models.SET_NULL)
 
@@ -102,9 +133,48 @@ class BlogPost(Page):
             # Raise an error?
             self.url_path = '/'
 
+    @property
+    def excerpt(self):
+        # plain text: strip_tags keeps entities, so they are decoded here and the result is
+        # escaped once when rendered
+        text = getattr(self, 'description', None)
+        if not text:
+            text = self.rendered_content if settings.USE_STREAMFIELD else self.content
+        return Truncator(unescape(strip_tags(text))).words(settings.EXCERPT_WORDS)
+
+    def serve(self, request, *args, **kwargs):
+        # neighbour links change whenever a sibling is (un)published, which bumps the parent's version
+        parent_version, parent_modified = get_index_version(self.path[:-Page.steplen])
+        etag_parts = (self.pk, timestamp(self.latest_revision_created_at), parent_version,
+                      request.GET.get('tag'), request.GET.get('category'))
+        last_modified = max(timestamp(self.latest_revision_created_at), parent_modified)
+        return serve_conditionally(request, lambda: super(BlogPost, self).serve(request, *args, **kwargs),
+                                   etag_parts, last_modified, settings.POST_CACHE_CONTROL)
+
     def get_siblings(self, inclusive=True):
-        return BlogPost.objects.sibling_of(self, inclusive).live().order_by('-date')
+        return BlogPost.objects.sibling_of(self, inclusive).live().order_by(*POST_ORDERING)
+
+    def _neighbour(self, posts):
+        # posts starts at this post if it is in the queryset at all; one LIMIT 2 query
+        posts = list(posts[:2])
+        if posts and posts[0].pk == self.pk:
+            return posts[1] if len(posts) > 1 else None
+        return None
 
+    def get_older_post(self, posts):
+        """
+        Return the post following this one in POST_ORDERING from the posts queryset, or None
+        if there is none or this post is not in posts, using a (date, pk) keyset comparison.
+        """
+        return self._neighbour(posts.filter(older_than(self.date, self.pk) | models.Q(pk=self.pk)).order_by(*POST_ORDERING))
+
+    def get_newer_posts(self, posts):
+        return posts.filter(newer_than(self.date, self.pk))
+
+    def get_newer_post(self, posts):
+        return self._neighbour(posts.filter(newer_than(self.date, self.pk) | models.Q(pk=self.pk)).order_by('date', 'pk'))
+
+    @timed('post-context')
     def get_context(self, request):
         context = super(BlogPost, self).get_context(request)
         siblings = self.get_siblings()
@@ -117,19 +187,18 @@ class BlogPost(Page):
             category = request.GET.get('category')
 
         if tag:
-            siblings = siblings.filter(tags__name=tag)
+            siblings = filter_posts_by_tag(siblings, tag)
             update_context_querystring(context,CONTEXT_POST_QUERYSTRING_KEY,first_arg=True,tag=tag)
         elif category:
             siblings = siblings.filter(category__slug=category)
             update_context_querystring(context,CONTEXT_POST_QUERYSTRING_KEY,first_arg=True,category=category)
 
-        ids = [obj.pk for obj in siblings]
-        if self.pk in ids:
-            idx = ids.index(self.pk)
-            if idx < len(siblings) - 1:
-                context['next_post'] = siblings[idx + 1]
-            if idx > 0:
-                context['prev_post'] = siblings[idx - 1]
+        next_post = self.get_older_post(siblings)
+        if next_post is not None:
+            context['next_post'] = next_post
+        prev_post = self.get_newer_post(siblings)
+        if prev_post is not None:
+            context['prev_post'] = prev_post
         return context
 
 BlogPost.content_panels = [] + Page.content_panels # need to copy the list, not alias it
@@ -155,32 +224,231 @@ if settings.USE_CATEGORIES:
 if settings.USE_TAGS:
     BlogPost.promote_panels = Page.promote_panels + [ FieldPanel('tags'), ]
 
+class BlogPostListing(models.Model):
+    """
+    Denormalized copy of what blog_index.html shows for a live post, kept in sync by the
+    handlers in blog.signals and rebuilt by the rebuild_blog_listing command.
+    """
+    post = models.OneToOneField(BlogPost, primary_key=True, related_name='listing', on_delete=models.CASCADE)
+    path = models.CharField(max_length=255, db_index=True) # treebeard path, for descendant lookups
+    title = models.CharField(max_length=255)
+    url_path = models.TextField()
+    date = models.DateField(db_index=True)
+    category_id = models.IntegerField(blank=True, null=True, db_index=True)
+    tag_names = models.TextField(blank=True) # ",tag one,tag two,"
+    excerpt = models.TextField(blank=True)
+    thumbnail_url = models.CharField(max_length=255, blank=True)
+    thumbnail_width = models.IntegerField(blank=True, null=True)
+    thumbnail_height = models.IntegerField(blank=True, null=True)
+    thumbnail_alt = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        index_together = [('date', 'post')]
+
+    @classmethod
+    def from_post(cls, post):
+        listing = cls(post=post, path=post.path, url_path=post.url_path, title=post.title, date=post.date, excerpt=post.excerpt)
+        if settings.USE_CATEGORIES:
+            listing.category_id = post.category_id
+        if settings.USE_TAGS:
+            tag_names = [tag.name for tag in post.tags.all()]
+            if tag_names:
+                listing.tag_names = ',%s,' % ','.join(tag_names)
+        if settings.USE_FEATURED_IMAGES and post.featured_image:
+            try:
+                rendition = post.featured_image.get_rendition(settings.LISTING_IMAGE_FILTER)
+            except SourceImageIOError:
+                pass
+            else:
+                listing.thumbnail_url = rendition.url
+                listing.thumbnail_width = rendition.width
+                listing.thumbnail_height = rendition.height
+                listing.thumbnail_alt = post.featured_image.title
+        return listing
+
+    @classmethod
+    def filter_tag(cls, listings, tag):
+        return listings.filter(tag_names__contains=',%s,' % tag)
+
+    def relative_url(self, current_site):
+        # lets {% pageurl %} render listing rows without loading the page
+        return relative_url_for_path(self.url_path, current_site)
+
+    @property
+    def featured_rendition(self):
+        if self.thumbnail_url:
+            return ListingThumbnail(self.thumbnail_url, self.thumbnail_width, self.thumbnail_height, self.thumbnail_alt)
+
+class ListingThumbnail(object):
+    def __init__(self, url, width, height, alt):
+        self.url = url
+        self.width = width
+        self.height = height
+        self.alt = alt
+
+class BlogExpandedText(models.Model):
+    """
+    Rich text of a published post with its links and embeds expanded, see blog.expansion.
+    """
+    post = models.OneToOneField(BlogPost, primary_key=True, related_name='expanded_text', on_delete=models.CASCADE)
+    html = models.TextField() # JSON: {md5 of source html: expanded html}
+
+class BlogExpandedTextLink(models.Model):
+    """
+    A page linked from a post's expanded text, with the url_path it had when expanded.
+    """
+    post = models.ForeignKey(BlogPost, related_name='expanded_links', on_delete=models.CASCADE)
+    # no constraint: links to deleted pages keep their row until the post is expanded again
+    page = models.ForeignKey(Page, related_name='+', on_delete=models.DO_NOTHING, db_constraint=False)
+    url_path = models.TextField()
+
+TAXONOMY_TAG = 'tag'
+TAXONOMY_CATEGORY = 'category'
+TAXONOMY_CHOICES = (
+    (TAXONOMY_TAG, _('Tag')),
+    (TAXONOMY_CATEGORY, _('Category')),
+)
+
+class BlogTaxonomyIndex(models.Model):
+    """
+    One row per live post and tag (key is the tag slug) or category (key is the category id),
+    maintained by blog.taxonomy.
+    """
+    post = models.ForeignKey(BlogPost, related_name='taxonomy_index', on_delete=models.CASCADE)
+    blog_id = models.IntegerField(db_index=True)
+    kind = models.CharField(max_length=10, choices=TAXONOMY_CHOICES)
+    key = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    date = models.DateField()
+
+    class Meta:
+        unique_together = [('post', 'kind', 'key')]
+        index_together = [('kind', 'name', 'date'), ('kind', 'key', 'date')]
+
+class BlogTaxonomyCount(models.Model):
+    """
+    Number of live posts per tag or category in a BlogType, maintained by blog.taxonomy.
+    """
+    blog_id = models.IntegerField()
+    kind = models.CharField(max_length=10, choices=TAXONOMY_CHOICES)
+    key = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('blog_id', 'kind', 'key')]
+
+class BlogArchiveCount(models.Model):
+    """
+    Number of live posts per month in a BlogType, for the archive sidebar; maintained by the
+    handlers in blog.signals and rebuilt by the rebuild_blog_archive command.
+    """
+    blog_id = models.IntegerField()
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('blog_id', 'year', 'month')]
+
+class BlogSearchDocument(models.Model):
+    """
+    Plain text of a live post for blog search; the full-text structures built on it are
+    managed by blog.search.
+    """
+    post = models.OneToOneField(BlogPost, primary_key=True, related_name='search_document', on_delete=models.CASCADE)
+    blog_id = models.IntegerField(db_index=True)
+    category_id = models.IntegerField(blank=True, null=True, db_index=True)
+    date = models.DateField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    tags = models.TextField(blank=True)
+    category = models.CharField(max_length=255, blank=True)
+
+class BlogRelatedPost(models.Model):
+    """
+    One of the RELATED_POSTS posts of the same blog sharing the most tags and category with a
+    post, maintained by blog.related.
+    """
+    post = models.ForeignKey(BlogPost, related_name='related_posts', on_delete=models.CASCADE)
+    related = models.ForeignKey(BlogPost, related_name='related_to', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = [('post', 'rank')]
+
 class BlogIndexBase(Page):
     is_abstract = True
 
     template = "blog/blog_index.html"
 
-    def get_context(self, request):
+    @timed('listing')
+    def get_context(self, request, archive=None):
         context = super(BlogIndexBase,self).get_context(request)
-        posts = self.get_posts(request)
+        if settings.USE_LISTING_TABLE:
+            posts = self.get_listings(request)
+        else:
+            posts = prefetch_listing(self.get_posts(request))
+        if archive is not None: # a date range on the indexed date column
+            posts = posts.filter(date__gte=archive.start, date__lt=archive.end)
+            context['archive'] = archive
 
         # Pagination
+        if settings.USE_CURSOR_PAGINATION:
+            paginator = CursorPaginator(posts, settings.POSTS_PER_PAGE)
+            posts = paginator.page(request.GET.get(CURSOR_QUERYSTRING_KEY))
+        else:
+            posts = self.paginate(request, posts)
+        if not settings.USE_LISTING_TABLE:
+            prefetch_listing_page(posts)
+
+        # Update template context
+        context['posts'] = posts
+        return context
+
+    def paginate(self, request, posts):
         page = request.GET.get('page')
         paginator = Paginator(posts, settings.POSTS_PER_PAGE)
         try:
-            posts = paginator.page(page)
+            return paginator.page(page)
         except PageNotAnInteger:
-            posts = paginator.page(1)
+            return paginator.page(1)
         except EmptyPage:
-            posts = paginator.page(paginator.num_pages)
+            return paginator.page(paginator.num_pages)
 
-        # Update template context
-        context['posts'] = posts
-        return context
+    def route(self, request, path_components):
+        feed_format = parse_feed_path(path_components)
+        if feed_format is not None:
+            if not self.live:
+                raise Http404
+            return RouteResult(self, kwargs={'feed_format': feed_format})
+        return super(BlogIndexBase,self).route(request, path_components)
+
+    cache_control_setting = 'INDEX_CACHE_CONTROL'
+
+    def serve(self, request, *args, **kwargs):
+        feed_format = kwargs.pop('feed_format', None)
+        if feed_format is not None:
+            return serve_feed(self, request, feed_format)
+
+        version, modified = get_listing_version(self, request)
+        key_parts = (self.pk, timestamp(self.latest_revision_created_at), version, sorted(request.GET.items()), sorted(kwargs.items()))
+        last_modified = max(timestamp(self.latest_revision_created_at), modified)
+
+        def respond():
+            if request.GET.get(SEARCH_QUERYSTRING_KEY):
+                return super(BlogIndexBase,self).serve(request, *args, **kwargs)
+            return serve_cached(request, key_parts, lambda: super(BlogIndexBase,self).serve(request, *args, **kwargs))
+        return serve_conditionally(request, respond, key_parts, last_modified, getattr(settings, self.cache_control_setting))
 
     # TODO: filter posts that have private tag, type, or category
     def get_posts(self, request=None):
-        return BlogPost.objects.descendant_of(self, False).live().order_by('-date')
+        return BlogPost.objects.descendant_of(self, False).live().order_by(*POST_ORDERING)
+
+    def get_listings(self, request=None):
+        # BlogPostListing counterpart of get_posts; only live posts have listing rows
+        return BlogPostListing.objects.filter(path__startswith=self.path).exclude(path=self.path).order_by(*POST_ORDERING)
 
     class Meta:
         abstract = True
@@ -196,27 +464,90 @@ class BlogType(BlogIndexBase):
             posts = super(BlogType,self).get_posts(request)
             tag = request.GET.get('tag')
             if tag:
-                posts = posts.filter(tags__name=tag)
+                posts = filter_posts_by_tag(posts, tag)
             return posts
 
-        def get_context(self, request):
-            context = super(BlogType,self).get_context(request)
+        def get_listings(self, request=None):
+            listings = super(BlogType,self).get_listings(request)
+            tag = request.GET.get('tag')
+            if tag:
+                listings = BlogPostListing.filter_tag(listings, tag)
+            return listings
+
+    def get_context(self, request, archive=None):
+        query = request.GET.get(SEARCH_QUERYSTRING_KEY, '').strip() if settings.USE_SEARCH else None
+        if query:
+            return self.get_search_context(request, query)
+        context = super(BlogType,self).get_context(request, archive)
+        if settings.USE_TAGS:
             tag = request.GET.get('tag')
             if tag:
                 update_context_querystring(context,CONTEXT_PAGE_QUERYSTRING_KEY,first_arg=False,tag=tag)
                 update_context_querystring(context,CONTEXT_POST_QUERYSTRING_KEY,first_arg=True,tag=tag)
-            return context
+        return context
+
+    @timed('search')
+    def get_search_context(self, request, query):
+        from blog.search import SearchResults
 
+        context = super(BlogIndexBase,self).get_context(request)
+        tag = request.GET.get('tag') if settings.USE_TAGS else None
+        category = request.GET.get('category') if settings.USE_CATEGORIES else None
+        tree = get_category_tree() if settings.USE_CATEGORIES else None
+        category_ids = None
+        if category:
+            category_ids = set()
+            for node in tree.nodes:
+                if node.slug == category:
+                    category_ids.update(tree.descendant_ids(node.id) if settings.INCLUDE_SUBCATEGORY_POSTS else [node.id])
+
+        results = SearchResults(self.pk, query, tag=tag, category_ids=category_ids)
+        posts = self.paginate(request, results)
+        prefetch_listing_page(posts)
+
+        filters = dict((key, value) for key, value in (('tag', tag), ('category', category)) if value)
+        update_context_querystring(context,CONTEXT_PAGE_QUERYSTRING_KEY,first_arg=False,q=query,**filters)
+        context['posts'] = posts
+        context['search_query'] = query
+        context['search_filters'] = filters
+        context['search_facets'] = facets = {}
+        for kind, counts in results.facets().items():
+            if kind == TAXONOMY_TAG:
+                facets[kind] = [{'value': name, 'name': name, 'count': count} for key, name, count in counts]
+            elif tree is not None and kind == TAXONOMY_CATEGORY:
+                nodes = [(tree.get(int(key)), count) for key, name, count in counts]
+                facets[kind] = [{'value': node.slug, 'name': node.title, 'count': count} for node, count in nodes if node]
+        return context
+
+    @timed('route')
     def route(self, request, path_components):
         # TODO: possibly better to use routable mix-in. Also may be better if this handles routing for (child) categories?
-        # also need to create month/day logic.
+        if parse_feed_path(path_components) is not None:
+            return super(BlogType,self).route(request, path_components)
+
         if path_components:
             # request is for a child of this page
             child_path = '/'.join(path_components+[''])
 
+            if settings.ROUTE_CACHE_ALIAS:
+                subpage = resolve_route(self, self.url_path+child_path)
+                if subpage is not None:
+                    return subpage.route(request, None)
+
+            if settings.USE_CATEGORIES: # categories at any depth, without walking the tree
+                node = get_category_tree().by_url_path.get(self.url_path+child_path)
+                if node is not None:
+                    return BlogCategory.objects.get(pk=node.id).route(request, None)
+
             try: # try posts or first level categories
                 subpage = self.get_children().get(url_path=self.url_path+child_path)
-            except Page.DoesNotExist: # use Page's route to get deeper categories
+            except Page.DoesNotExist:
+                archive = parse_archive_path(path_components)
+                if archive is not None: # year, month or day archive
+                    if not self.live:
+                        raise Http404
+                    return RouteResult(self, kwargs={'archive': archive})
+                # use Page's route to get deeper categories
                 return super(BlogType,self).route(request,path_components)
 
             return subpage.specific.route(request, None)
@@ -232,6 +563,7 @@ if settings.USE_CATEGORIES:
     class BlogCategory(BlogIndexBase):
         subpage_types = ['blog.BlogCategory']
         template = BlogIndexBase.template
+        cache_control_setting = 'CATEGORY_CACHE_CONTROL'
 
         def get_context(self, request):
             context = super(BlogCategory,self).get_context(request)
@@ -239,19 +571,52 @@ if settings.USE_CATEGORIES:
             return context
 
         def get_posts(self, request=None):
-            return BlogPost.objects.filter(category=self).live().order_by('-date')
+            if settings.INCLUDE_SUBCATEGORY_POSTS:
+                # treebeard paths: subcategories share this category's path as prefix
+                posts = BlogPost.objects.filter(category__path__startswith=self.path)
+            else:
+                posts = BlogPost.objects.filter(category=self)
+            return posts.live().order_by(*POST_ORDERING)
+
+        def get_listings(self, request=None):
+            if settings.INCLUDE_SUBCATEGORY_POSTS:
+                listings = BlogPostListing.objects.filter(category_id__in=get_category_tree().descendant_ids(self.pk))
+            else:
+                listings = BlogPostListing.objects.filter(category_id=self.pk)
+            return listings.order_by(*POST_ORDERING)
+
+        def get_breadcrumbs(self):
+            return get_category_tree().ancestors(self.pk)
 
 class AjaxBlogPage(Page):
     blog_page = models.ForeignKey(BlogType, related_name='ajax_user', blank=True, null=True, on_delete=models.SET_NULL)
 
+    @timed('ajax-route')
     def route(self, request, path_components):
+        if path_components == [FRAGMENT_PATH]:
+            if not self.live:
+                raise Http404
+            return RouteResult(self, kwargs={'fragments': True})
         result = super(AjaxBlogPage,self).route(request,path_components)
         if isinstance(result, RouteResult):
             result_page = result[0]
-            if result_page == self.blog_page or result_page == self or self.blog_page.get_descendants().filter(id__in=[result_page.id]).exists():
+            if result_page.pk == self.pk or self.in_blog_page(result_page):
                 return RouteResult(self,kwargs={'true_request_page': result_page})
         return result
 
+    def in_blog_page(self, page):
+        # materialized paths: descendants (and the page itself) share the blog page's path as prefix
+        if self.blog_page_id is None:
+            return False
+        blog_path = get_page_path(self.blog_page_id)
+        return blog_path is not None and page.path.startswith(blog_path)
+
+    def serve(self, request, *args, **kwargs):
+        if kwargs.pop('fragments', False):
+            return serve_fragments(self, request)
+        return super(AjaxBlogPage,self).serve(request, *args, **kwargs)
+
+    @timed('ajax-context')
     def get_context(self, request, *args, **kwargs):
         true_request_page = kwargs.pop('true_request_page', None)
         context = super(AjaxBlogPage, self).get_context(request, *args, **kwargs)
@@ -262,35 +627,24 @@ class AjaxBlogPage(Page):
                 tag = request.GET.get('tag')
             if settings.USE_CATEGORIES:
                 if isinstance(true_request_page, BlogCategory):
-                    category = true_request_page
+                    category = true_request_page.slug
                 else:
                     category = request.GET.get('category') 
 
-            if isinstance(true_request_page, BlogPost):
-                siblings = true_request_page.get_siblings()
-
             if tag:
                 update_context_querystring(context,CONTEXT_POST_QUERYSTRING_KEY,first_arg=False,tag=tag)
-                if isinstance(true_request_page, BlogPost):
-                    siblings = siblings.filter(tags__name=tag)
-                context['taxonomy_name'] = 'tags'
+                context['taxonomy_name'] = 'tag'
                 context['taxonomy_value'] = tag
             elif category:
                 update_context_querystring(context,CONTEXT_POST_QUERYSTRING_KEY,first_arg=False,category=category)
-                if isinstance(true_request_page, BlogPost):
-                    siblings = siblings.filter(category__slug=category)
                 context['taxonomy_name'] = 'category'
                 context['taxonomy_value'] = category
 
+            context['fragments_url'] = self.url + FRAGMENT_PATH + '/'
             if isinstance(true_request_page, BlogPost):
-                for i, x in enumerate(siblings):
-                    if x == true_request_page:
-                        offset = i
+                context['cursor'] = encode_position(AT, true_request_page.date, true_request_page.pk)
             else:
-                offset = 0
-
-            context['offset'] = offset
-            context['limit'] = settings.POSTS_PER_PAGE
+                context['cursor'] = ''
 
             return context
 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Keyset (cursor) pagination over posts ordered by POST_ORDERING, i.e. (-date, -pk).
+
+Cursors are opaque querystring tokens holding a direction and the (date, pk) of the post
+at the edge of the current page, so moving to the next or previous page is a single
+indexed LIMIT query with no COUNT and no OFFSET scan.
+"""
+from __future__ import unicode_literals
+
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+CURSOR_QUERYSTRING_KEY = 'cursor'
+
+OLDER = 'o'
+NEWER = 'n'
+AT = 'a' # the page starting at the position itself, e.g. the post a visitor opened
+
+
+def older_than(date, pk):
+    return Q(date__lt=date) | Q(date=date, pk__lt=pk)
+
+def at_or_older_than(date, pk):
+    return Q(date__lt=date) | Q(date=date, pk__lte=pk)
+
+def newer_than(date, pk):
+    return Q(date__gt=date) | Q(date=date, pk__gt=pk)
+
+def encode_cursor(direction, post):
+    return encode_position(direction, post.date, post.pk)
+
+def encode_position(direction, date, pk):
+    raw = '%s%s|%d' % (direction, date.isoformat(), pk)
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """
+    Return (direction, date, pk) for a cursor token, or None if it is missing or malformed.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(str(token) + '=' * (-len(token) % 4)).decode('ascii')
+        direction, raw = raw[0], raw[1:]
+        date, pk = raw.split('|')
+        if direction not in (OLDER, NEWER, AT):
+            return None
+        return direction, datetime.strptime(date, '%Y-%m-%d').date(), int(pk)
+    except (TypeError, ValueError, IndexError, UnicodeError, binascii.Error):
+        return None
+
+
+class CursorPage(object):
+    """
+    Quacks enough like django.core.paginator.Page for blog_index.html; the template links
+    with next_cursor/previous_cursor instead of page numbers.
+    """
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_cursor(self):
+        if self.has_next():
+            return encode_cursor(OLDER, self.object_list[-1])
+
+    def previous_cursor(self):
+        if self.has_previous():
+            return encode_cursor(NEWER, self.object_list[0])
+
+
+class CursorPaginator(object):
+    def __init__(self, posts, per_page):
+        self.posts = posts
+        self.per_page = int(per_page)
+
+    def page(self, token=None):
+        cursor = decode_cursor(token)
+        if cursor is None:
+            object_list = list(self.posts[:self.per_page + 1])
+            return CursorPage(object_list[:self.per_page], len(object_list) > self.per_page, False)
+
+        direction, date, pk = cursor
+        if direction in (OLDER, AT):
+            position = older_than(date, pk) if direction == OLDER else at_or_older_than(date, pk)
+            object_list = list(self.posts.filter(position)[:self.per_page + 1])
+            return CursorPage(object_list[:self.per_page], len(object_list) > self.per_page, True)
+
+        # walk towards newer posts in ascending order, then flip back to newest first
+        newer = self.posts.filter(newer_than(date, pk)).reverse()
+        object_list = list(newer[:self.per_page + 1])
+        has_previous = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        object_list.reverse()
+        return CursorPage(object_list, True, has_previous)
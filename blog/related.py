@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Related posts: for every live post, the RELATED_POSTS live posts of the same blog sharing
+the most with it, stored in BlogRelatedPost and enabled with USE_RELATED_POSTS.
+
+Tags and the category are terms weighted by inverse document frequency, so a shared rare
+tag counts for more than a shared common one; ties go to the newer post. TermIndex is the
+inverted index of one blog. Scoring a post walks the subsets of its terms from the highest
+weight down, intersecting posting sets, and stops once enough posts are found, so the work
+is in set operations rather than a score per candidate post.
+
+rebuild_blog_related computes every post; publishing recomputes only the lists the post
+may enter or leave, from an index holding just the terms of those posts with their complete
+postings. Its cost grows with how many posts share those terms, not with the blog: a tag on
+a large share of the posts still loads that share. Terms on every post relate nothing and
+are skipped, and weights drift as terms are used more until the next rebuild.
+"""
+from __future__ import unicode_literals
+
+import heapq
+import math
+import operator
+from collections import defaultdict
+from functools import reduce
+from itertools import combinations, groupby
+
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from wagtail.wagtailcore.models import Page
+
+from blog import settings
+
+TAG = 'tag'
+CATEGORY = 'category'
+
+MAX_TERMS = 6 # highest weighted terms of a post used for scoring
+CHUNK_SIZE = 500
+
+
+class TermIndex(object):
+    """
+    Tags and categories of the live posts below the BlogType at blog_path, inverted. With
+    post_ids, only the terms of those posts are indexed, which is enough to score them.
+    """
+    def __init__(self, blog_path, exclude=None, post_ids=None):
+        from blog.models import BlogPost
+
+        posts = BlogPost.objects.live().filter(path__startswith=blog_path, depth=len(blog_path) // Page.steplen + 1)
+        if exclude is not None:
+            posts = posts.exclude(pk=exclude)
+        self.order = {} # pk: sort key, newest first
+        self.terms = defaultdict(set)
+        if post_ids is None:
+            indexed = None
+            self._load(posts)
+            total = len(self.order)
+        else:
+            self._load(posts.filter(pk__in=list(post_ids)))
+            indexed = set(term for terms in self.terms.values() for term in terms)
+            if indexed:
+                self._load(posts.filter(self._having(indexed)))
+            total = posts.count()
+
+        postings = defaultdict(list)
+        for post_id, terms in self.terms.items():
+            for term in terms:
+                if indexed is None or term in indexed: # other postings are incomplete
+                    postings[term].append(post_id)
+        self.postings = {} # term: (pks newest first, set of pks)
+        self.weights = {}
+        for term, post_ids in postings.items():
+            if 1 < len(post_ids) < total: # terms of one post or of every post relate nothing
+                post_ids.sort(key=self.order.__getitem__)
+                self.postings[term] = (post_ids, set(post_ids))
+                self.weights[term] = math.log(float(total) / len(post_ids))
+
+    def _load(self, posts):
+        fields = ['pk', 'date'] + (['category_id'] if settings.USE_CATEGORIES else [])
+        for row in posts.values_list(*fields):
+            self.order[row[0]] = (-row[1].toordinal(), -row[0])
+            if len(row) > 2 and row[2]:
+                self.terms[row[0]].add((CATEGORY, row[2]))
+        if settings.USE_TAGS:
+            from blog.models import BlogPostTag
+            for post_id, tag_id in BlogPostTag.objects.filter(content_object__in=posts).values_list('content_object_id', 'tag_id'):
+                self.terms[post_id].add((TAG, tag_id))
+
+    def _having(self, terms):
+        # posts with any of terms
+        conditions = []
+        tag_ids = [key for kind, key in terms if kind == TAG]
+        if tag_ids:
+            from blog.models import BlogPostTag
+            conditions.append(Q(pk__in=BlogPostTag.objects.filter(tag_id__in=tag_ids).values('content_object_id')))
+        category_ids = [key for kind, key in terms if kind == CATEGORY]
+        if category_ids:
+            conditions.append(Q(category_id__in=category_ids))
+        return reduce(operator.or_, conditions)
+
+    def weighted_terms(self, post_id):
+        return [term for term in self.terms.get(post_id, ()) if term in self.weights]
+
+    def scored_terms(self, post_id):
+        return sorted(self.weighted_terms(post_id), key=self.weights.__getitem__, reverse=True)[:MAX_TERMS]
+
+    def _matches(self, subset, seen):
+        # (sort key, pk) of the posts having every term of subset, newest first
+        if len(subset) == 1:
+            return ((self.order[pk], pk) for pk in self.postings[subset[0]][0] if pk not in seen)
+        common = set.intersection(*sorted((self.postings[term][1] for term in subset), key=len))
+        return sorted((self.order[pk], pk) for pk in common if pk not in seen)
+
+    def related(self, post_id, count):
+        """
+        [(pk, score)] of the best related posts, best first.
+        """
+        terms = self.scored_terms(post_id)
+        subsets = [(sum(self.weights[term] for term in subset), subset)
+                   for size in range(len(terms), 0, -1) for subset in combinations(terms, size)]
+        subsets.sort(key=lambda entry: -entry[0])
+
+        # posts sharing more terms than a subset score higher, so they were taken with an
+        # earlier subset; posts of subsets with equal scores are merged by date
+        seen = set([post_id])
+        related = []
+        for score, group in groupby(subsets, key=lambda entry: round(entry[0], 9)):
+            for key, pk in heapq.merge(*[self._matches(subset, seen) for weight, subset in group]):
+                if pk in seen:
+                    continue
+                seen.add(pk)
+                related.append((pk, score))
+                if len(related) == count:
+                    return related
+        return related
+
+    def shared_weight(self, post_id, other_id):
+        # at least the score other_id gives post_id
+        return sum(self.weights[term] for term in self.weighted_terms(post_id) if other_id in self.postings[term][1])
+
+
+@transaction.atomic
+def store_related(index, post_ids):
+    from blog.models import BlogRelatedPost
+
+    post_ids = list(post_ids)
+    for i in range(0, len(post_ids), CHUNK_SIZE):
+        chunk = post_ids[i:i + CHUNK_SIZE]
+        BlogRelatedPost.objects.filter(post_id__in=chunk).delete()
+        BlogRelatedPost.objects.bulk_create([
+            BlogRelatedPost(post_id=post_id, related_id=related_id, rank=rank, score=score)
+            for post_id in chunk for rank, (related_id, score) in enumerate(index.related(post_id, settings.RELATED_POSTS))
+        ])
+
+def rebuild_related(blog):
+    """
+    Compute and store the related posts of every live post of a BlogType.
+    """
+    index = TermIndex(blog.path)
+    store_related(index, sorted(index.order))
+    return len(index.order)
+
+def _open_lists(post_ids):
+    # {pk: (stored related posts, lowest score)} for the lists of post_ids
+    from blog.models import BlogRelatedPost
+
+    lists = {}
+    post_ids = list(post_ids)
+    for i in range(0, len(post_ids), CHUNK_SIZE):
+        rows = (BlogRelatedPost.objects.filter(post_id__in=post_ids[i:i + CHUNK_SIZE]).values('post_id')
+                .annotate(count=Count('pk'), low=Min('score')).values_list('post_id', 'count', 'low'))
+        lists.update((post_id, (count, low)) for post_id, count, low in rows)
+    return lists
+
+def update_related(post, removed=False):
+    """
+    Recompute the lists a post's tags and category change: its own, the lists it is in, and
+    the lists it may now enter. Pass removed=True before deleting a still live post.
+    """
+    from blog.models import BlogRelatedPost
+
+    blog_path = post.path[:-Page.steplen]
+    exclude = post.pk if removed else None
+    index = TermIndex(blog_path, exclude=exclude, post_ids=[post.pk])
+    affected = set(BlogRelatedPost.objects.filter(related_id=post.pk).values_list('post_id', flat=True))
+    affected.add(post.pk)
+    if post.pk in index.order:
+        candidates = set()
+        for term in index.weighted_terms(post.pk):
+            candidates.update(index.postings[term][1])
+        candidates -= affected
+        count = settings.RELATED_POSTS
+        for pk, (stored, low) in _open_lists(candidates).items():
+            if stored >= count and index.shared_weight(post.pk, pk) < low:
+                candidates.discard(pk)
+        affected.update(candidates)
+    store_related(TermIndex(blog_path, exclude=exclude, post_ids=affected), affected)
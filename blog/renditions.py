@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Work out which renditions a post needs and generate them ahead of the first visitor.
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from wagtail.wagtailimages.formats import get_image_format
+from wagtail.wagtailimages.models import Filter, SourceImageIOError, get_image_model
+
+from blog import settings
+from blog.instrumentation import timed
+
+
+logger = logging.getLogger('blog.renditions')
+
+_prefetched = threading.local()
+
+
+def iter_raw_stream(stream_value):
+    """
+    Yield (block_type, value) for the top level blocks of a StreamValue in their JSON form,
+    without running to_python on them.
+    """
+    if getattr(stream_value, 'is_lazy', False):
+        for child in stream_value.stream_data:
+            yield child['type'], child['value']
+    else:
+        for child in stream_value.stream_block.get_prep_value(stream_value):
+            yield child['type'], child['value']
+
+def stream_rendition_specs(stream_value):
+    specs = set()
+    for block_type, value in iter_raw_stream(stream_value):
+        if block_type == 'image' and value.get('image'):
+            try:
+                format = get_image_format(value.get('format'))
+            except KeyError:
+                continue
+            specs.add((value['image'], format.filter_spec))
+    return specs
+
+def post_rendition_specs(post):
+    """
+    Return the set of (image id, filter spec) pairs rendering this post needs: every
+    ImageBlock in the StoryBlock and the listing thumbnail of the featured image.
+    """
+    specs = set()
+    if settings.USE_STREAMFIELD:
+        specs |= stream_rendition_specs(post.content)
+    if settings.USE_FEATURED_IMAGES and post.featured_image_id:
+        specs.add((post.featured_image_id, settings.LISTING_IMAGE_FILTER))
+    return specs
+
+def find_renditions(images, specs):
+    """
+    Return {(image id, filter spec): rendition} for the existing renditions of (image id,
+    filter spec) pairs, in one query; images maps the ids to their images. A filter that
+    varies on the focal point only matches a rendition made for the image's current one,
+    under the focal_point_key get_rendition would look for.
+    """
+    specs = set((image_id, spec) for image_id, spec in specs if image_id in images)
+    if not specs:
+        return {}
+    filters = dict((spec, Filter(spec=spec)) for image_id, spec in specs)
+    Rendition = get_image_model().get_rendition_model()
+    renditions = {}
+    for rendition in Rendition.objects.filter(
+            image_id__in=set(image_id for image_id, spec in specs),
+            filter__spec__in=set(filters)).select_related('filter'):
+        key = (rendition.image_id, rendition.filter.spec)
+        if key in specs and rendition.focal_point_key == filters[key[1]].get_cache_key(images[key[0]]):
+            rendition.image = images[key[0]]
+            renditions[key] = rendition
+    return renditions
+
+def missing_rendition_specs(specs):
+    """
+    Drop the pairs that already have a rendition, in two queries.
+    """
+    specs = set(specs)
+    if not specs:
+        return specs
+    images = get_image_model().objects.in_bulk(set(image_id for image_id, spec in specs))
+    return specs - set(find_renditions(images, specs))
+
+@timed('renditions')
+def generate_renditions(specs):
+    """
+    Create the renditions for (image id, filter spec) pairs. Returns the number generated;
+    images whose source file is missing are skipped, and any other failure is logged and
+    skipped too, so one broken image does not stop the rest.
+    """
+    specs = list(specs)
+    images = get_image_model().objects.in_bulk(set(image_id for image_id, spec in specs))
+    count = 0
+    for image_id, spec in specs:
+        image = images.get(image_id)
+        if image is None:
+            continue
+        try:
+            image.get_rendition(spec)
+        except SourceImageIOError:
+            continue
+        except Exception:
+            logger.exception("Could not generate rendition %s of image %s", spec, image_id)
+            continue
+        count += 1
+    return count
+
+def prewarm_post(post):
+    return generate_renditions(missing_rendition_specs(post_rendition_specs(post)))
+
+@contextmanager
+def prefetched_renditions(stream_value):
+    """
+    Load every image an ImageBlock in stream_value uses, and their existing renditions, in
+    one query each. While the context is active, PrefetchedImageChooserBlock.to_python and
+    ImageBlock.render read from these maps instead of querying per block.
+    """
+    specs = stream_rendition_specs(stream_value)
+    images = {}
+    renditions = {}
+    if specs:
+        images = get_image_model().objects.in_bulk(set(image_id for image_id, spec in specs))
+        renditions = find_renditions(images, specs)
+
+    previous = getattr(_prefetched, 'maps', None)
+    _prefetched.maps = (images, renditions)
+    try:
+        yield
+    finally:
+        _prefetched.maps = previous
+
+def get_prefetched_image(image_id):
+    maps = getattr(_prefetched, 'maps', None)
+    if maps:
+        return maps[0].get(image_id)
+
+def get_prefetched_rendition(image, filter_spec):
+    maps = getattr(_prefetched, 'maps', None)
+    if maps:
+        return maps[1].get((image.pk, filter_spec))
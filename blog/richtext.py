@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Single-pass cleanup of the rich text StoryTextArea submits, run on the already whitelisted
+database HTML:
+
+- empty paragraphs (nothing but whitespace, &nbsp; and <br>) are dropped;
+- text and inline elements outside a block are wrapped in <p>, and a <br> at that level
+  starts a new paragraph;
+- lists and other blocks inside a paragraph are moved out of it, splitting the paragraph.
+
+Uses the standard library's streaming tokenizer instead of building a tree.
+"""
+from __future__ import unicode_literals
+
+try:
+    from html.parser import HTMLParser
+except ImportError: # Python 2
+    from HTMLParser import HTMLParser
+
+BLOCK_TAGS = frozenset(['ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'table', 'div', 'hr'])
+VOID_TAGS = frozenset(['br', 'hr', 'img', 'embed', 'input', 'wbr', 'source'])
+BLANK_ENTITIES = frozenset(['nbsp', '#160', '#xa0', '#xA0'])
+
+
+class StoryHTMLNormalizer(HTMLParser):
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.convert_charrefs = False # keep entities as submitted
+        self.output = []
+        self.paragraph = None # pieces of the open paragraph
+        self.explicit = False # the open paragraph came from a <p> rather than bare content
+        self.has_content = False
+        self.inline = [] # (tag, start tag text) of the inline tags open in the paragraph
+        self.pending = [] # inline tags a top-level <br> left open, reopened with the next paragraph
+        self.block = None # top-level block being copied through, and its nesting depth
+        self.block_depth = 0
+
+    def open_paragraph(self, start_tag='<p>', explicit=False):
+        self.paragraph = [start_tag]
+        self.explicit = explicit
+        self.has_content = False
+        self.inline = []
+        if not explicit:
+            self.paragraph.extend(text for tag, text in self.pending)
+            self.inline = self.pending
+        self.pending = []
+
+    def close_paragraph(self, carry=False):
+        if self.paragraph is not None:
+            if self.has_content:
+                self.output.extend(self.paragraph)
+                self.output.extend('</%s>' % tag for tag, text in reversed(self.inline))
+                self.output.append('</p>')
+            self.paragraph = None
+            self.pending = self.inline if carry else []
+        elif not carry:
+            self.pending = []
+        self.inline = []
+
+    def inline_data(self, text, blank):
+        if self.paragraph is None:
+            if blank:
+                return
+            self.open_paragraph()
+        self.paragraph.append(text)
+        self.has_content = self.has_content or not blank
+
+    def handle_starttag(self, tag, attrs):
+        text = self.get_starttag_text()
+        if self.block:
+            self.output.append(text)
+            if tag == self.block:
+                self.block_depth += 1
+        elif tag == 'p':
+            self.close_paragraph()
+            self.open_paragraph(text, explicit=True)
+        elif tag in BLOCK_TAGS:
+            self.close_paragraph()
+            self.output.append(text)
+            if tag not in VOID_TAGS:
+                self.block, self.block_depth = tag, 1
+        elif tag == 'br':
+            if self.paragraph is not None and self.explicit:
+                self.paragraph.append(text)
+            else:
+                self.close_paragraph(carry=True)
+        else:
+            if self.paragraph is None:
+                self.open_paragraph()
+            self.paragraph.append(text)
+            if tag in VOID_TAGS:
+                self.has_content = True
+            else:
+                self.inline.append((tag, text))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if self.inline and self.inline[-1][0] == tag:
+            self.inline.pop() # <span/> and the like
+
+    def handle_endtag(self, tag):
+        if self.block:
+            self.output.append('</%s>' % tag)
+            if tag == self.block:
+                self.block_depth -= 1
+                if not self.block_depth:
+                    self.block = None
+        elif tag == 'p':
+            self.close_paragraph()
+        elif self.paragraph is None:
+            # closes a tag left open by a <br> before any content followed
+            if tag in [open_tag for open_tag, text in self.pending]:
+                while self.pending.pop()[0] != tag:
+                    pass
+        elif tag in [open_tag for open_tag, text in self.inline]:
+            while self.inline:
+                open_tag = self.inline.pop()[0]
+                self.paragraph.append('</%s>' % open_tag)
+                if open_tag == tag:
+                    break
+        # anything else closes nothing that is open; drop it
+
+    def handle_data(self, data):
+        if self.block:
+            self.output.append(data)
+        else:
+            self.inline_data(data, not data.strip())
+
+    def handle_entityref(self, name):
+        self.handle_reference('&%s;' % name, name)
+
+    def handle_charref(self, name):
+        self.handle_reference('&#%s;' % name, '#' + name)
+
+    def handle_reference(self, text, name):
+        if self.block:
+            self.output.append(text)
+        else:
+            self.inline_data(text, name in BLANK_ENTITIES)
+
+    def normalize(self, html):
+        self.feed(html)
+        self.close()
+        self.close_paragraph()
+        if self.block:
+            self.output.append('</%s>' % self.block)
+        return ''.join(self.output)
+
+
+def normalize_story_html(html):
+    if not html:
+        return html
+    return StoryHTMLNormalizer().normalize(html)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+url_path -> (page id, content type id) routes for the pages below BlogType pages.
+
+Routes are kept in the ROUTE_CACHE_ALIAS cache, one key per url_path, so every process shares
+them and saving one page never rewrites the entries of another. A warm lookup is one cache
+get and the query loading the page itself, instead of a query per level of the tree.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+from uuid import uuid4
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.utils.encoding import force_bytes
+
+from wagtail.wagtailcore.models import Page, Site
+
+from blog import settings
+
+_page_paths = {} # version: {page id: treebeard path}
+
+PAGE_PATHS_VERSION_KEY = 'blog:page-paths-version'
+NO_ROUTE = () # cached for url_paths without a page, e.g. archive pages
+NO_ROUTE_TIMEOUT = 60*60
+
+
+def get_route_cache():
+    if settings.ROUTE_CACHE_ALIAS:
+        return caches[settings.ROUTE_CACHE_ALIAS]
+
+def _route_key(url_path):
+    return 'blog:route:%s' % hashlib.md5(force_bytes(url_path)).hexdigest()
+
+def _route_entries(page, inclusive):
+    rows = Page.objects.descendant_of(page, inclusive).values_list('url_path', 'pk', 'content_type_id')
+    return dict((_route_key(url_path), (pk, content_type_id)) for url_path, pk, content_type_id in rows)
+
+def update_routes(page):
+    """
+    Store the routes of page and its descendants, if it is or is below a BlogType. Called
+    after pages are created, moved or change slug or date. Routes left at old url_paths are
+    dropped by resolve_route when it finds them stale.
+    """
+    from blog.models import BlogType
+
+    blog_id = BlogType.objects.ancestor_of(page, inclusive=True).values_list('pk', flat=True).first()
+    if blog_id is not None:
+        get_route_cache().set_many(_route_entries(page, blog_id != page.pk), None)
+
+def invalidate_routes(page):
+    # for pages added or removed without signals, e.g. bulk imports and rolled back benchmarks
+    get_route_cache().delete_many(list(_route_entries(page, True)))
+
+def resolve_route(blog, url_path):
+    """
+    Return the specific page at url_path below blog, or None if there is none. The caller
+    routes to the page, which raises Http404 if it is not live. Routes found stale, after a
+    move or a delete, are dropped and looked up again on the next request.
+    """
+    cache = get_route_cache()
+    key = _route_key(url_path)
+    entry = cache.get(key)
+    if entry is None:
+        entry = Page.objects.filter(path__startswith=blog.path, url_path=url_path).values_list('pk', 'content_type_id').first() or NO_ROUTE
+        # add, not set: a concurrent save storing the route wins over this read
+        cache.add(key, entry, None if entry else NO_ROUTE_TIMEOUT)
+    if not entry:
+        return None
+    pk, content_type_id = entry
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    page = model.objects.filter(pk=pk).first()
+    if page is None or page.url_path != url_path:
+        cache.delete(key)
+        return None
+    return page
+
+def _page_paths_version():
+    cache = caches[settings.CACHE_ALIAS]
+    version = cache.get(PAGE_PATHS_VERSION_KEY)
+    if version is None:
+        cache.add(PAGE_PATHS_VERSION_KEY, uuid4().hex, None)
+        version = cache.get(PAGE_PATHS_VERSION_KEY)
+    return version
+
+def get_page_path(page_id):
+    """
+    Treebeard path of a page. Each process keeps the paths it loaded until the version
+    stored in CACHE_ALIAS changes, which clear_page_paths does whenever a page save may
+    have moved part of the tree.
+    """
+    version = _page_paths_version()
+    paths = _page_paths.get(version)
+    if paths is None:
+        _page_paths.clear()
+        paths = _page_paths[version] = {}
+    path = paths.get(page_id)
+    if path is None:
+        path = Page.objects.filter(pk=page_id).values_list('path', flat=True).first()
+        if path is not None:
+            paths[page_id] = path
+    return path
+
+def clear_page_paths():
+    _page_paths.clear()
+    caches[settings.CACHE_ALIAS].set(PAGE_PATHS_VERSION_KEY, uuid4().hex, None)
+
+def relative_url_for_path(url_path, current_site):
+    """
+    Page.relative_url for a bare url_path, for rows that stand in for pages.
+    """
+    for (id, root_path, root_url) in Site.get_site_root_paths():
+        if url_path.startswith(root_path):
+            return ('' if current_site.id == id else root_url) + reverse('wagtail_serve', args=(url_path[len(root_path):],))
+
+def url_for_path(url_path):
+    """
+    Page.url for a bare url_path: relative with a single site, absolute otherwise.
+    """
+    root_paths = Site.get_site_root_paths()
+    for (id, root_path, root_url) in root_paths:
+        if url_path.startswith(root_path):
+            return ('' if len(root_paths) == 1 else root_url) + reverse('wagtail_serve', args=(url_path[len(root_path):],))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Blog post full-text search.
+
+BlogSearchDocument holds the plain text of every live post. The full-text structure on top of
+it depends on the database: an FTS5 table (blog_search_fts) on SQLite, a weighted tsvector
+column with a GIN index on PostgreSQL, and plain LIKE matching anywhere else. All of them are
+created by migration 0008.
+"""
+from __future__ import unicode_literals
+
+from django.db import connection, transaction
+from django.utils.html import strip_tags
+
+from blog import settings
+from blog.listing import prefetch_listing
+from blog.models import BlogPost, BlogSearchDocument, TAXONOMY_TAG
+from blog.renditions import iter_raw_stream
+
+FTS_TABLE = 'blog_search_fts'
+LIKE_ESCAPE = '!'
+
+
+def extract_text(post):
+    """
+    Searchable text of a post's body, taken from the stored content without rendering it.
+    """
+    if not settings.USE_STREAMFIELD:
+        return strip_tags(post.content or '')
+    parts = []
+    for block_type, value in iter_raw_stream(post.content):
+        if block_type == 'paragraph':
+            parts.append(strip_tags(value))
+        elif block_type in ('h2', 'h3', 'h4'):
+            parts.append(value)
+        elif block_type == 'pullquote':
+            parts.extend([value.get('quote'), value.get('attribution')])
+        elif block_type == 'image':
+            parts.extend([value.get('caption'), value.get('alt_text')])
+    return '\n'.join(part for part in parts if part)
+
+def build_document(post, blog_id):
+    document = BlogSearchDocument(post_id=post.pk, blog_id=blog_id, date=post.date, title=post.title, body=extract_text(post))
+    if settings.USE_TAGS:
+        document.tags = ' '.join(tag.name for tag in post.tags.all())
+    if settings.USE_CATEGORIES and post.category_id:
+        document.category_id = post.category_id
+        document.category = post.category.title
+    return document
+
+
+class FallbackBackend(object):
+    """
+    LIKE matching ordered by date, for databases without a supported full-text engine.
+    """
+    def update_fulltext(self, cursor, post_ids):
+        pass
+
+    def remove_fulltext(self, cursor, post_ids):
+        pass
+
+    def match(self, query):
+        """
+        Return (from_sql, where_sql, params, order_sql, order_params) matching query.
+        """
+        # % and _ in the query are literal characters, not wildcards
+        for char in (LIKE_ESCAPE, '%', '_'):
+            query = query.replace(char, LIKE_ESCAPE + char)
+        like = '%%%s%%' % query
+        where = ' OR '.join("%s LIKE %%s ESCAPE '%s'" % (column, LIKE_ESCAPE) for column in ('d.title', 'd.body', 'd.tags'))
+        return ('blog_blogsearchdocument d',
+                '(%s)' % where, [like, like, like],
+                'd.date DESC, d.post_id DESC', [])
+
+
+class SQLiteBackend(FallbackBackend):
+    def update_fulltext(self, cursor, post_ids):
+        self.remove_fulltext(cursor, post_ids)
+        cursor.execute(
+            "INSERT INTO %s (rowid, title, body, tags, category) "
+            "SELECT post_id, title, body, tags, category FROM blog_blogsearchdocument WHERE post_id IN (%s)"
+            % (FTS_TABLE, ', '.join(['%s'] * len(post_ids))), post_ids)
+
+    def remove_fulltext(self, cursor, post_ids):
+        cursor.execute("DELETE FROM %s WHERE rowid IN (%s)" % (FTS_TABLE, ', '.join(['%s'] * len(post_ids))), post_ids)
+
+    def match(self, query):
+        # quote every term so user input cannot use the FTS5 query syntax
+        terms = ' '.join('"%s"' % term.replace('"', '""') for term in query.split())
+        return ('blog_blogsearchdocument d JOIN %s ON %s.rowid = d.post_id' % (FTS_TABLE, FTS_TABLE),
+                '%s MATCH %%s' % FTS_TABLE, [terms],
+                'bm25(%s)' % FTS_TABLE, [])
+
+
+class PostgresBackend(FallbackBackend):
+    def update_fulltext(self, cursor, post_ids):
+        cursor.execute(
+            "UPDATE blog_blogsearchdocument SET search_vector = "
+            "setweight(to_tsvector(title), 'A') || "
+            "setweight(to_tsvector(tags || ' ' || category), 'B') || "
+            "setweight(to_tsvector(body), 'C') "
+            "WHERE post_id IN (%s)" % ', '.join(['%s'] * len(post_ids)), post_ids)
+
+    def match(self, query):
+        return ('blog_blogsearchdocument d',
+                'd.search_vector @@ plainto_tsquery(%s)', [query],
+                'ts_rank(d.search_vector, plainto_tsquery(%s)) DESC', [query])
+
+
+_backend = None
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        if connection.vendor == 'postgresql':
+            _backend = PostgresBackend()
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            _backend = SQLiteBackend()
+        else:
+            _backend = FallbackBackend()
+    return _backend
+
+
+@transaction.atomic
+def index_posts(posts, blog_id):
+    # replaces the documents of posts in one transaction, so searches see either the old
+    # documents or the new ones
+    documents = [build_document(post, blog_id) for post in posts]
+    if not documents:
+        return
+    post_ids = [document.post_id for document in documents]
+    BlogSearchDocument.objects.filter(post_id__in=post_ids).delete()
+    BlogSearchDocument.objects.bulk_create(documents)
+    get_search_backend().update_fulltext(connection.cursor(), post_ids)
+
+@transaction.atomic
+def unindex_posts(post_ids):
+    post_ids = list(post_ids)
+    if post_ids:
+        get_search_backend().remove_fulltext(connection.cursor(), post_ids)
+        BlogSearchDocument.objects.filter(post_id__in=post_ids).delete()
+
+
+class SearchResults(object):
+    """
+    Lazily evaluated, ranked search results that Paginator can slice: count() and each page
+    are one query each, and pages come back as BlogPost objects ready for listing.
+    """
+    def __init__(self, blog_id, query, tag=None, category_ids=None, backend=None):
+        self.backend = backend or get_search_backend()
+        from_sql, where_sql, params, self.order_sql, self.order_params = self.backend.match(query)
+        where = ['d.blog_id = %s', where_sql]
+        params = [blog_id] + params
+        if tag:
+            where.append("d.post_id IN (SELECT post_id FROM blog_blogtaxonomyindex WHERE kind = %s AND name = %s)")
+            params += [TAXONOMY_TAG, tag]
+        if category_ids is not None:
+            if category_ids:
+                where.append('d.category_id IN (%s)' % ', '.join(['%s'] * len(category_ids)))
+                params += list(category_ids)
+            else:
+                where.append('1 = 0')
+        self.from_sql = from_sql
+        self.where_sql = ' AND '.join(where)
+        self.params = params
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            cursor = connection.cursor()
+            cursor.execute('SELECT COUNT(*) FROM %s WHERE %s' % (self.from_sql, self.where_sql), self.params)
+            self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        limit = (index.stop - start) if index.stop is not None else self.count() - start
+        cursor = connection.cursor()
+        cursor.execute('SELECT d.post_id FROM %s WHERE %s ORDER BY %s LIMIT %%s OFFSET %%s' % (self.from_sql, self.where_sql, self.order_sql),
+                       self.params + self.order_params + [max(limit, 0), start])
+        post_ids = [row[0] for row in cursor.fetchall()]
+        posts = prefetch_listing(BlogPost.objects.filter(pk__in=post_ids)).in_bulk(post_ids)
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+    def facets(self):
+        """
+        Tag and category counts over all matching posts, from the taxonomy index:
+        {kind: [(key, name, count), ...]}, most frequent first.
+        """
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT t.kind, t.key, t.name, COUNT(*) FROM blog_blogtaxonomyindex t '
+            'WHERE t.post_id IN (SELECT d.post_id FROM %s WHERE %s) '
+            'GROUP BY t.kind, t.key, t.name ORDER BY COUNT(*) DESC, t.name' % (self.from_sql, self.where_sql), self.params)
+        facets = {}
+        for kind, key, name, count in cursor.fetchall():
+            facets.setdefault(kind, []).append((key, name, count))
+        return facets
@@ -7,10 +7,40 @@ DEFAULT_SETTINGS = {
     "DATE_FORMAT": "%Y/%b/", # end with trailing slash.
     "DATE_FUNCTION": 'title', # upper, lower
     "USE_CATEGORIES": True,
+    "INCLUDE_SUBCATEGORY_POSTS": False, # category pages also list posts of their subcategories
     "USE_TAGS": True,
     "USE_FEATURED_IMAGES": True,
+    "LISTING_IMAGE_FILTER": "max-150x150", # featured image thumbnails on index pages
+    "PREWARM_RENDITIONS_ON_PUBLISH": False, # generate a post's renditions once its publish commits; or run prewarm_blog_renditions
+    "EXPAND_RICH_TEXT_ON_PUBLISH": True, # store expanded links and embeds; run rebuild_blog_expanded_text for existing posts
     "POSTS_PER_PAGE": 10,
-    "USE_STREAMFIELD": False
+    "USE_CURSOR_PAGINATION": False, # ?cursor= keyset tokens instead of ?page= numbers
+    "USE_STREAMFIELD": False,
+    "USE_TAXONOMY_INDEX": False, # filter tags through BlogTaxonomyIndex, which is always maintained; run rebuild_blog_taxonomy first
+    "USE_SEARCH": False, # ?q= on BlogType pages; run rebuild_blog_search to index existing posts
+    "USE_LISTING_TABLE": False, # read index pages from BlogPostListing; run rebuild_blog_listing first
+    "USE_RELATED_POSTS": False, # keep related posts up to date on publish; run rebuild_blog_related first
+    "RELATED_POSTS": 5, # stored per post
+    "EXCERPT_WORDS": 100,
+    "RENDER_CACHE_ALIAS": None, # cache alias for rendered StreamField content, e.g. 'default'
+    "RENDER_CACHE_TIMEOUT": 60*60*24*7,
+    "RENDER_CACHE_MAX_SIZE": 256*1024, # bigger renders are not cached
+    "CACHE_ALIAS": 'default', # index version tokens behind feeds and HTTP validators; must be shared by all processes
+    "CONDITIONAL_GET": False, # ETag/Last-Modified and 304s for posts and index pages; needs a shared CACHE_ALIAS
+    "POST_CACHE_CONTROL": None, # keyword arguments for patch_cache_control, e.g. {'public': True, 'max_age': 300}
+    "INDEX_CACHE_CONTROL": None,
+    "CATEGORY_CACHE_CONTROL": None,
+    "RESPONSE_CACHE_ALIAS": None, # cache alias for whole index pages served to anonymous visitors
+    "RESPONSE_CACHE_TIMEOUT": 60*60,
+    "FEED_ITEMS": 20,
+    "FEED_CACHE_ALIAS": 'default',
+    "FEED_CACHE_TIMEOUT": 60*60*24,
+    "INSTRUMENTATION": False, # timers on hot paths; also add blog.instrumentation.InstrumentationMiddleware
+    "INSTRUMENTATION_CACHE_ALIAS": 'default', # rolling samples for the admin report
+    "INSTRUMENTATION_SAMPLES": 1000, # kept per timer
+    "CATEGORY_TREE_CACHE_ALIAS": 'default', # snapshot of all categories; must be shared by all processes
+    "CATEGORY_TREE_CACHE_TIMEOUT": 60*60,
+    "ROUTE_CACHE_ALIAS": None, # cache alias for the routes of pages below BlogType pages; must be shared by all processes
 }
 
 USER_SETTINGS = DEFAULT_SETTINGS.copy()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Keeps the denormalized blog tables in step with the page tree.
+"""
+from __future__ import unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete
+
+from wagtail.wagtailcore.models import Page, get_page_models
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+from blog import settings
+from blog.archives import change_month_count
+from blog.caching import refresh_rendered_content, bump_index_versions, bump_paths, ancestor_paths
+from blog.categories import invalidate_category_tree
+from blog.expansion import expand_posts, unexpand_post, reexpand_linking_posts
+from blog.related import update_related
+from blog.renditions import prewarm_post
+from blog.routing import update_routes, clear_page_paths
+from blog.models import BlogPost, BlogPostListing, TAXONOMY_TAG, TAXONOMY_CATEGORY
+if settings.USE_CATEGORIES:
+    from blog.models import BlogCategory
+from blog.search import index_posts, unindex_posts
+from blog.taxonomy import index_post, unindex_post, get_blog_id, indexed_taxonomy, post_taxonomy
+
+
+# BlogTaxonomyIndex is maintained whatever USE_TAXONOMY_INDEX says, which only switches tag
+# filtering over to it: its rows are also the tags and category a post was last published
+# with, which bump_post_indexes needs to refresh the listings a post leaves, and its counts
+# back the tag and category clouds and search facets. index_post only touches the rows of
+# the one post.
+
+def bump_post_indexes(post):
+    # old entries from the taxonomy index, new ones from the post itself
+    taxonomy = indexed_taxonomy(post)
+    if post.live:
+        taxonomy.update(post_taxonomy(post))
+    tag_names = [name for (kind, key), name in taxonomy.items() if kind == TAXONOMY_TAG]
+    category_ids = [int(key) for (kind, key), name in taxonomy.items() if kind == TAXONOMY_CATEGORY]
+    bump_index_versions(post, tag_names, category_ids)
+
+def post_published(sender, instance, **kwargs):
+    bump_post_indexes(instance)
+    if settings.PREWARM_RENDITIONS_ON_PUBLISH:
+        # after the commit, so resizing images neither holds the publish transaction open
+        # nor can roll it back
+        transaction.on_commit(lambda: prewarm_post(instance))
+    if settings.EXPAND_RICH_TEXT_ON_PUBLISH:
+        expand_posts([instance])
+    if settings.USE_STREAMFIELD:
+        refresh_rendered_content(instance)
+    if settings.USE_LISTING_TABLE:
+        BlogPostListing.from_post(instance).save()
+    index_post(instance)
+    if settings.USE_RELATED_POSTS:
+        update_related(instance)
+    if settings.USE_SEARCH:
+        blog_id = get_blog_id(instance)
+        if blog_id:
+            index_posts([instance], blog_id)
+
+def post_unpublished(sender, instance, **kwargs):
+    bump_post_indexes(instance)
+    if settings.EXPAND_RICH_TEXT_ON_PUBLISH:
+        unexpand_post(instance)
+    if settings.USE_LISTING_TABLE:
+        BlogPostListing.objects.filter(post_id=instance.pk).delete()
+    index_post(instance)
+    if settings.USE_RELATED_POSTS:
+        update_related(instance)
+    if settings.USE_SEARCH:
+        unindex_posts([instance.pk])
+
+def post_deleted(sender, instance, **kwargs):
+    if instance.live:
+        bump_post_indexes(instance)
+        blog_id = get_blog_id(instance)
+        if blog_id:
+            change_month_count(blog_id, instance.date, -1)
+        if settings.USE_RELATED_POSTS:
+            update_related(instance, removed=True)
+    unindex_post(instance)
+    if settings.USE_SEARCH:
+        unindex_posts([instance.pk])
+
+def category_deleted(sender, instance, **kwargs):
+    invalidate_category_tree()
+
+ROUTE_FIELDS = set(['url_path', 'slug', 'path', 'live', 'date'])
+
+def page_loaded(sender, instance, **kwargs):
+    # read from __dict__: touching a deferred field would load it
+    instance._blog_loaded_url_path = instance.__dict__.get('url_path')
+
+def page_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Remember the url_path and parent before the save, for relink_posts and bump_moved_page.
+    # Slug changes and moves set the new url_path on the instance before saving it, so a
+    # url_path still equal to the one the page was loaded with has not changed and needs no
+    # query.
+    instance._blog_old_url_path = instance._blog_old_parent = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not ROUTE_FIELDS & set(update_fields):
+        return
+    loaded = getattr(instance, '_blog_loaded_url_path', None)
+    if loaded is not None and loaded == instance.url_path:
+        return
+    old_url_path = Page.objects.filter(pk=instance.pk).values_list('url_path', flat=True).first()
+    if old_url_path is not None and old_url_path != instance.url_path:
+        instance._blog_old_url_path = old_url_path
+        instance._blog_old_parent = old_parent(old_url_path)
+
+def old_parent(old_url_path):
+    """
+    (pk, path) of the parent of the page stored at old_url_path. Page.move has already moved
+    the stored row when it saves the page, so the parent is the deepest page whose url_path
+    is a prefix of the old one; posts have DATE_FORMAT segments between them and their blog.
+    """
+    segments = old_url_path.strip('/').split('/')
+    prefixes = ['/%s/' % '/'.join(segments[:n]) for n in range(1, len(segments))]
+    return Page.objects.filter(url_path__in=prefixes).order_by('-depth').values_list('pk', 'path').first()
+
+def as_post(page):
+    # Page.move saves a plain Page, so posts are told apart by content type
+    if isinstance(page, BlogPost):
+        return page
+    if page.content_type_id == ContentType.objects.get_for_model(BlogPost).id:
+        return page.specific
+
+def bump_moved_page(page, parent):
+    """
+    Listings link to a page and everything below it by url_path, so after a move or slug
+    change every index showing them, at the old place below parent and the new one, gets a
+    new version.
+    """
+    tag_names = ()
+    post = as_post(page)
+    if post is not None:
+        bump_post_indexes(post)
+        paths = set()
+        tag_names = [name for (kind, key), name in post_taxonomy(post).items() if kind == TAXONOMY_TAG]
+    else:
+        paths = set(Page.objects.descendant_of(page, inclusive=True).not_type(BlogPost).values_list('path', flat=True))
+        paths.update(ancestor_paths(page.path))
+    if parent:
+        paths.update(ancestor_paths(parent[1], inclusive=True))
+    bump_paths(paths, tag_names)
+
+def post_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # the stored live flag and date, for update_archive_counts; a revision being published
+    # carries its draft values, so they are read from the database. Connected for every page
+    # model, as Page.move saves posts as plain Pages.
+    instance._blog_old_archive = None
+    if raw or (update_fields is not None and not set(['live', 'date', 'path']) & set(update_fields)):
+        return
+    if not isinstance(instance, BlogPost) and instance.content_type_id != ContentType.objects.get_for_model(BlogPost).id:
+        return
+    stored = BlogPost.objects.filter(pk=instance.pk).values_list('live', 'date').first() if instance.pk else None
+    instance._blog_old_archive = stored or (False, None)
+
+def update_archive_counts(post, old_archive, old_url_path, old_parent):
+    """
+    Move the post from the archive month it counted in before the save to the one it counts
+    in now, if either changed.
+    """
+    old_live, old_date = old_archive
+    moved = old_url_path and old_url_path != post.url_path
+    if (old_live, old_date) == (post.live, post.date) and not moved:
+        return
+    blog_id = old_blog_id = get_blog_id(post)
+    if moved:
+        old_blog_id = old_parent[0] if old_parent else None
+    old = (old_blog_id, old_date.year, old_date.month) if old_live and old_blog_id else None
+    new = (blog_id, post.date.year, post.date.month) if post.live and blog_id else None
+    if old != new:
+        if old:
+            change_month_count(old_blog_id, old_date, -1)
+        if new:
+            change_month_count(blog_id, post.date, 1)
+
+def relink_posts(page, old_url_path):
+    # posts linking to or below page: new expansions, renders and validators
+    for post in reexpand_linking_posts(page, old_url_path):
+        bump_post_indexes(post)
+        if settings.USE_STREAMFIELD:
+            refresh_rendered_content(post)
+
+def page_saved(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or not isinstance(instance, Page):
+        return
+    if update_fields is None or ROUTE_FIELDS & set(update_fields) or 'title' in update_fields:
+        clear_page_paths()
+        old_url_path = getattr(instance, '_blog_old_url_path', None)
+        old_parent = getattr(instance, '_blog_old_parent', None)
+        post = as_post(instance)
+        if post is not None and getattr(instance, '_blog_old_archive', None):
+            update_archive_counts(post, instance._blog_old_archive, old_url_path, old_parent)
+        if settings.USE_CATEGORIES and post is None:
+            invalidate_category_tree()
+        moved = old_url_path and old_url_path != instance.url_path
+        if settings.ROUTE_CACHE_ALIAS and (created or moved):
+            update_routes(instance)
+        if moved:
+            bump_moved_page(instance, old_parent)
+            if settings.EXPAND_RICH_TEXT_ON_PUBLISH:
+                relink_posts(instance, old_url_path)
+            # Moves and slug changes rewrite path/url_path for the page and all its descendants
+            # without publishing them; publishing a post is handled by post_published. Reordering
+            # siblings only shifts treebeard paths, which rebuild_blog_listing picks up.
+            if settings.USE_LISTING_TABLE and post is None:
+                sync_listing_locations(instance)
+
+def sync_listing_locations(page):
+    posts = BlogPost.objects.descendant_of(page, inclusive=True)
+    rows = BlogPostListing.objects.filter(post__in=posts).values_list('post_id', 'path', 'url_path', 'post__path', 'post__url_path')
+    for post_id, path, url_path, new_path, new_url_path in rows:
+        if path != new_path or url_path != new_url_path:
+            BlogPostListing.objects.filter(post_id=post_id).update(path=new_path, url_path=new_url_path)
+
+def register_signal_handlers():
+    page_published.connect(post_published, sender=BlogPost)
+    page_unpublished.connect(post_unpublished, sender=BlogPost)
+    for model in set([Page] + list(get_page_models())):
+        post_init.connect(page_loaded, sender=model)
+        pre_save.connect(page_saving, sender=model)
+        pre_save.connect(post_saving, sender=model)
+    post_save.connect(page_saved)
+    pre_delete.connect(post_deleted, sender=BlogPost)
+    if settings.USE_CATEGORIES:
+        pre_delete.connect(category_deleted, sender=BlogCategory)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Incremental maintenance of BlogTaxonomyIndex and BlogTaxonomyCount.
+"""
+from __future__ import unicode_literals
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from blog import settings
+from blog.models import BlogType, BlogTaxonomyIndex, BlogTaxonomyCount, TAXONOMY_TAG, TAXONOMY_CATEGORY
+
+
+def get_blog_id(post):
+    return BlogType.objects.ancestor_of(post).values_list('pk', flat=True).first()
+
+def post_taxonomy(post):
+    """
+    Return {(kind, key): name} for the tags and category of a post.
+    """
+    taxonomy = {}
+    if settings.USE_TAGS:
+        for tag in post.tags.all():
+            taxonomy[(TAXONOMY_TAG, tag.slug)] = tag.name
+    if settings.USE_CATEGORIES and post.category_id:
+        taxonomy[(TAXONOMY_CATEGORY, str(post.category_id))] = post.category.title
+    return taxonomy
+
+def indexed_taxonomy(post):
+    """
+    Return {(kind, key): name} as currently stored in the index for a post.
+    """
+    return dict(((kind, key), name) for kind, key, name in BlogTaxonomyIndex.objects.filter(post_id=post.pk).values_list('kind', 'key', 'name'))
+
+def _change_count(blog_id, kind, key, name, delta):
+    updated = BlogTaxonomyCount.objects.filter(blog_id=blog_id, kind=kind, key=key).update(count=F('count') + delta, name=name)
+    if not updated and delta > 0:
+        try:
+            with transaction.atomic():
+                BlogTaxonomyCount.objects.create(blog_id=blog_id, kind=kind, key=key, name=name, count=delta)
+        except IntegrityError:
+            # created concurrently
+            BlogTaxonomyCount.objects.filter(blog_id=blog_id, kind=kind, key=key).update(count=F('count') + delta)
+
+@transaction.atomic
+def index_post(post):
+    """
+    Bring the index rows and counts for one post up to date: live posts get a row per tag and
+    category, anything else gets none. Only the differences touch the counts.
+    """
+    old = dict(((row.kind, row.key), row) for row in BlogTaxonomyIndex.objects.filter(post_id=post.pk))
+    blog_id = get_blog_id(post) if post.live else None
+    new = post_taxonomy(post) if blog_id else {}
+
+    for taxonomy_key, row in list(old.items()):
+        if taxonomy_key not in new or row.blog_id != blog_id:
+            row.delete()
+            _change_count(row.blog_id, row.kind, row.key, row.name, -1)
+            del old[taxonomy_key]
+
+    added = []
+    for (kind, key), name in new.items():
+        if (kind, key) not in old:
+            added.append(BlogTaxonomyIndex(post_id=post.pk, blog_id=blog_id, kind=kind, key=key, name=name, date=post.date))
+            _change_count(blog_id, kind, key, name, 1)
+    BlogTaxonomyIndex.objects.bulk_create(added)
+
+    if old:
+        BlogTaxonomyIndex.objects.filter(post_id=post.pk).exclude(date=post.date).update(date=post.date)
+
+@transaction.atomic
+def unindex_post(post):
+    for row in BlogTaxonomyIndex.objects.filter(post_id=post.pk):
+        _change_count(row.blog_id, row.kind, row.key, row.name, -1)
+    BlogTaxonomyIndex.objects.filter(post_id=post.pk).delete()
@@ -1,5 +1,82 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+from datetime import date
+
 from django import template
 
+from blog.archives import MONTH, get_month_counts, archive_url_path
+from blog.categories import get_category_tree
+from blog.models import BlogTaxonomyCount, TAXONOMY_TAG, TAXONOMY_CATEGORY
+from blog.routing import relative_url_for_path
+
 register = template.Library()
+
+
+def _weighted(counts, steps):
+    # weight 1..steps, scaled linearly between the least and most used entries
+    if counts:
+        low = min(count.count for count in counts)
+        spread = max(count.count for count in counts) - low
+        for count in counts:
+            count.weight = 1 + ((count.count - low) * (steps - 1) // spread if spread else 0)
+    return counts
+
+@register.inclusion_tag('blog/includes/tag_cloud.html')
+def blog_tag_cloud(blog, steps=5):
+    """
+    Tags used by live posts of a BlogType, with counts, from the precomputed taxonomy index.
+    """
+    counts = list(BlogTaxonomyCount.objects.filter(blog_id=blog.pk, kind=TAXONOMY_TAG, count__gt=0).order_by('name'))
+    return {'blog': blog, 'tags': _weighted(counts, steps)}
+
+@register.inclusion_tag('blog/includes/category_cloud.html')
+def blog_category_cloud(blog, steps=5):
+    from blog.models import BlogCategory
+
+    counts = list(BlogTaxonomyCount.objects.filter(blog_id=blog.pk, kind=TAXONOMY_CATEGORY, count__gt=0).order_by('name'))
+    categories = BlogCategory.objects.in_bulk([int(count.key) for count in counts])
+    counts = [count for count in counts if int(count.key) in categories]
+    for count in counts:
+        count.category = categories[int(count.key)]
+    return {'blog': blog, 'categories': _weighted(counts, steps)}
+
+@register.inclusion_tag('blog/includes/category_breadcrumbs.html', takes_context=True)
+def blog_category_breadcrumbs(context, category):
+    """
+    Links to a category and the categories above it, from the cached category tree.
+    category may be a BlogCategory or its id.
+    """
+    category_id = getattr(category, 'pk', category)
+    request = context.get('request')
+    site = getattr(request, 'site', None)
+    crumbs = []
+    for node in get_category_tree().ancestors(category_id):
+        crumbs.append({'title': node.title, 'url': relative_url_for_path(node.url_path, site) if site else node.url_path})
+    return {'crumbs': crumbs}
+
+@register.inclusion_tag('blog/includes/archive_months.html', takes_context=True)
+def blog_archive_months(context, blog):
+    """
+    Links to the month archives of a BlogType with their post counts, from the per-month
+    counts that saving posts keeps up to date.
+    """
+    request = context.get('request')
+    site = getattr(request, 'site', None)
+    months = []
+    for year, month, count in get_month_counts(blog.pk):
+        url_path = archive_url_path(blog.url_path, MONTH, date(year, month, 1))
+        if url_path is None:
+            break
+        months.append({'date': date(year, month, 1), 'count': count,
+                       'url': relative_url_for_path(url_path, site) if site else url_path})
+    return {'blog': blog, 'months': months}
+
+@register.inclusion_tag('blog/includes/related_posts.html')
+def blog_related_posts(post):
+    """
+    The precomputed related posts of a post (see blog.related), in one query.
+    """
+    from blog.models import BlogPost
+
+    posts = BlogPost.objects.live().filter(related_to__post_id=post.pk).order_by('related_to__rank')
+    return {'posts': posts}
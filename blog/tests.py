@@ -1,6 +1,55 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from django.test import TestCase
+import io
+import json
+import os
+from contextlib import contextmanager
+from datetime import date
+from uuid import uuid4
+from unittest import skipIf, skipUnless
+
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils.cache import patch_vary_headers
+from django.utils.html import conditional_escape
+from django.utils.safestring import SafeData
+from django.utils.six import StringIO
+
+from wagtail.wagtailcore.models import Page, Site
+
+from blog import settings as blog_settings
+from blog.models import AjaxBlogPage, BlogType, BlogPost
+from blog.archives import YEAR, MONTH, DAY, archive_segments, parse_archive_path, compute_month_counts, get_month_counts, rebuild_month_counts
+from blog.benchmark import generate_blog, run_benchmarks
+from blog.caching import serve_cached
+from blog.instrumentation import timed, server_timing, start_collecting, stop_collecting, _state
+from blog.expansion import expand_posts, render_post_content
+from blog.export import plan_export
+from blog.importing import PostImporter, read_json, read_wxr, story_blocks, story_html
+from blog.related import TermIndex, rebuild_related, update_related
+from blog.richtext import normalize_story_html
+from blog.routing import resolve_route
+from blog.search import FallbackBackend, SearchResults, index_posts
+from blog.taxonomy import index_post
+from blog.templatetags.blog_tags import blog_related_posts
+from blog.pagination import encode_cursor, encode_position, decode_cursor, AT, OLDER, NEWER
+
+
+@contextmanager
+def blog_settings_changed(**values):
+    # blog.settings is read when BLOG_SETTINGS is first imported, so override_settings misses it
+    old = dict((name, getattr(blog_settings, name)) for name in values)
+    for name, value in values.items():
+        setattr(blog_settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            setattr(blog_settings, name, value)
 
 
 class blogTest(TestCase):
@@ -9,3 +58,555 @@ class blogTest(TestCase):
     """
     def test_blog(self):
         pass
+
+
+class ExcerptTest(TestCase):
+    @skipIf(blog_settings.USE_STREAMFIELD, "rich text content only")
+    def test_excerpt_is_escaped(self):
+        post = BlogPost(title="Post", slug='post', date=date(2016, 1, 1), content='<p>&lt;script&gt;alert(1)&lt;/script&gt; text</p>')
+        self.assertNotIsInstance(post.excerpt, SafeData)
+        self.assertNotIn('<script>', conditional_escape(post.excerpt))
+
+    @skipIf(blog_settings.USE_STREAMFIELD, "rich text content only")
+    def test_entities_render_once(self):
+        post = BlogPost(title="Post", slug='post', date=date(2016, 1, 1), content='<p>Fish &amp; chips&nbsp;&lt;3</p>')
+        rendered = Template('{{ post.excerpt }}').render(Context({'post': post}))
+        self.assertEqual(rendered, u'Fish &amp; chips\xa0&lt;3')
+
+
+class CursorTest(TestCase):
+    class FakePost(object):
+        def __init__(self, date, pk):
+            self.date = date
+            self.pk = pk
+
+    def test_round_trip(self):
+        post = self.FakePost(date(2016, 1, 31), 42)
+        self.assertEqual(decode_cursor(encode_cursor(OLDER, post)), (OLDER, date(2016, 1, 31), 42))
+        self.assertEqual(decode_cursor(encode_cursor(NEWER, post)), (NEWER, date(2016, 1, 31), 42))
+        self.assertEqual(decode_cursor(encode_cursor(AT, post)), (AT, date(2016, 1, 31), 42))
+
+    def test_malformed(self):
+        for token in (None, '', 'garbage', '!!!', encode_cursor('x', self.FakePost(date(2016, 1, 1), 1))):
+            self.assertIsNone(decode_cursor(token))
+
+
+class NeighbourTest(TestCase):
+    def setUp(self):
+        blog = Site.objects.get(is_default_site=True).root_page.add_child(instance=BlogType(title="Blog", slug='blog'))
+        self.posts = [blog.add_child(instance=BlogPost(title="Post %d" % day, slug='post-%d' % day, date=date(2016, 1, day)))
+                      for day in (1, 2, 3)]
+
+    def test_neighbours(self):
+        older, middle, newer = self.posts
+        posts = middle.get_siblings()
+        self.assertEqual(middle.get_older_post(posts).pk, older.pk)
+        self.assertEqual(middle.get_newer_post(posts).pk, newer.pk)
+        self.assertIsNone(older.get_older_post(posts))
+        self.assertIsNone(newer.get_newer_post(posts))
+
+    def test_none_outside_posts(self):
+        older, middle, newer = self.posts
+        posts = middle.get_siblings().exclude(pk=middle.pk)
+        self.assertIsNone(middle.get_older_post(posts))
+        self.assertIsNone(middle.get_newer_post(posts))
+
+
+class NormalizeStoryHTMLTest(TestCase):
+    def test_drops_empty_paragraphs(self):
+        self.assertEqual(normalize_story_html('<p></p><p> &nbsp;<br/></p><p><b></b></p><p>text</p>'), '<p>text</p>')
+
+    def test_wraps_bare_text(self):
+        self.assertEqual(normalize_story_html('bare <b>text</b><br/>next line<p>para</p>'),
+                         '<p>bare <b>text</b></p><p>next line</p><p>para</p>')
+
+    def test_moves_lists_out_of_paragraphs(self):
+        self.assertEqual(normalize_story_html('<p>before<ul><li>a</li></ul>after</p>'),
+                         '<p>before</p><ul><li>a</li></ul><p>after</p>')
+
+    def test_keeps_embeds_and_entities(self):
+        html = '<p><embed embedtype="image" id="1"/></p><p>a &amp; b<br/>c</p>'
+        self.assertEqual(normalize_story_html(html), html)
+
+    def test_break_inside_inline_tag(self):
+        self.assertEqual(normalize_story_html('<b>bold<br/></b>'), '<p><b>bold</b></p>')
+        self.assertEqual(normalize_story_html('<b>one<br/>two</b>'), '<p><b>one</b></p><p><b>two</b></p>')
+
+    def test_inline_tag_closed_after_paragraph(self):
+        self.assertEqual(normalize_story_html('<p><b>x</p></b>'), '<p><b>x</b></p>')
+
+
+class InstrumentationTest(TestCase):
+    @skipIf(blog_settings.INSTRUMENTATION, "timers are enabled")
+    def test_disabled_timer_is_the_function(self):
+        def view():
+            pass
+        self.assertIs(timed('view')(view), view)
+
+    def test_totals(self):
+        start_collecting()
+        _state.measurements.extend([('route', 0.002, 2), ('route', 0.001, 1), ('listing', 0.004, 4)])
+        totals = stop_collecting()
+        self.assertEqual(totals['route'][0], 2)
+        self.assertEqual(totals['route'][2], 3)
+        self.assertEqual(server_timing(totals), 'blog-listing;dur=4.00;desc="1 calls, 4 queries", blog-route;dur=3.00;desc="2 calls, 3 queries"')
+
+
+class AjaxBlogPageRouteTest(TestCase):
+    def setUp(self):
+        root = Page.objects.get(depth=1)
+        self.ajax_page = root.add_child(instance=AjaxBlogPage(title="Ajax", slug='ajax'))
+        self.blog = self.ajax_page.add_child(instance=BlogType(title="Blog", slug='blog'))
+        self.post = self.blog.add_child(instance=BlogPost(title="Post", slug='post', date=date(2016, 1, 31)))
+        self.ajax_page.blog_page = self.blog
+        self.ajax_page.save()
+        self.request = RequestFactory().get('/')
+        self.path_components = self.post.url_path[len(self.ajax_page.url_path):].strip('/').split('/')
+
+    def test_routes_blog_pages_through_ajax_page(self):
+        result = self.ajax_page.route(self.request, self.path_components)
+        self.assertEqual(result[0].pk, self.ajax_page.pk)
+        self.assertEqual(result[2]['true_request_page'].pk, self.post.pk)
+
+    def test_membership_check_costs_no_queries(self):
+        ajax_page = AjaxBlogPage.objects.get(pk=self.ajax_page.pk)
+        ajax_page.route(self.request, self.path_components) # load the blog page path
+
+        with CaptureQueriesContext(connection) as tree_walk:
+            Page.route(ajax_page, self.request, self.path_components)
+        with CaptureQueriesContext(connection) as ajax_route:
+            ajax_page.route(self.request, self.path_components)
+        self.assertEqual(len(ajax_route), len(tree_walk))
+
+
+class AjaxFragmentsTest(TestCase):
+    def setUp(self):
+        root = Page.objects.get(depth=1)
+        self.ajax_page = root.add_child(instance=AjaxBlogPage(title="Ajax", slug='ajax'))
+        self.blog = self.ajax_page.add_child(instance=BlogType(title="Blog", slug='blog'))
+        self.posts = [self.blog.add_child(instance=BlogPost(title="Post %d" % day, slug='post-%d' % day, date=date(2016, 1, day)))
+                      for day in (1, 2, 3)]
+        self.ajax_page.blog_page = self.blog
+        self.ajax_page.save()
+
+    def get_fragments(self, cursor=''):
+        request = RequestFactory().get('/', {'cursor': cursor})
+        request.site = Site.objects.first()
+        response = self.ajax_page.serve(request, fragments=True)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_routes_fragments(self):
+        result = self.ajax_page.route(RequestFactory().get('/'), ['fragments'])
+        self.assertEqual(result[2], {'fragments': True})
+
+    def test_starts_at_requested_post(self):
+        newest, middle, oldest = reversed(self.posts)
+        data = self.get_fragments(encode_position(AT, middle.date, middle.pk))
+        self.assertEqual([post['id'] for post in data['posts']], [middle.pk, oldest.pk])
+        self.assertIsNone(data['older'])
+
+        data = self.get_fragments(data['newer'])
+        self.assertEqual([post['id'] for post in data['posts']], [newest.pk])
+        self.assertIsNone(data['newer'])
+
+
+class RouteCacheTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.blog = Site.objects.get(is_default_site=True).root_page.add_child(instance=BlogType(title="Blog", slug='blog'))
+
+    def test_follows_slug_changes(self):
+        with blog_settings_changed(ROUTE_CACHE_ALIAS='default'):
+            post = self.blog.add_child(instance=BlogPost(title="Post", slug='post', date=date(2016, 1, 31)))
+            old_url_path = post.url_path
+            with self.assertNumQueries(1):
+                self.assertEqual(resolve_route(self.blog, old_url_path).pk, post.pk)
+            post.slug = 'renamed'
+            post.save()
+            self.assertIsNone(resolve_route(self.blog, old_url_path))
+            self.assertEqual(resolve_route(self.blog, post.url_path).pk, post.pk)
+            self.assertIsNone(resolve_route(self.blog, self.blog.url_path + '2016/'))
+
+
+class ExpansionTest(TestCase):
+    def setUp(self):
+        site_root = Site.objects.get(is_default_site=True).root_page
+        self.blog = site_root.add_child(instance=BlogType(title="Blog", slug='blog'))
+        self.target = self.blog.add_child(instance=BlogPost(title="Target", slug='target', date=date(2016, 1, 1)))
+        self.post = self.blog.add_child(instance=BlogPost(title="Post", slug='post', date=date(2016, 1, 2),
+                                                          content='<p><a linktype="page" id="%d">target</a></p>' % self.target.pk))
+        expand_posts([self.post])
+
+    def test_renders_stored_expansion(self):
+        post = BlogPost.objects.get(pk=self.post.pk)
+        with self.assertNumQueries(1):
+            html = render_post_content(post)
+        self.assertIn('<a href="%s">' % self.target.url, html)
+
+    def test_reexpands_when_linked_page_moves(self):
+        self.target.slug = 'moved'
+        self.target.save()
+        post = BlogPost.objects.get(pk=self.post.pk)
+        self.assertIn('/moved/', render_post_content(post))
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        site_root = Site.objects.get(is_default_site=True).root_page
+        self.blog = site_root.add_child(instance=BlogType(title="Blog", slug='blog'))
+        self.posts = [self.blog.add_child(instance=BlogPost(title="Post %d" % n, slug='post-%d' % n, date=day))
+                      for n, day in enumerate((date(2015, 12, 31), date(2016, 1, 1), date(2016, 1, 31), date(2016, 2, 1)))]
+
+    def test_parses_canonical_paths_only(self):
+        for kind in (YEAR, MONTH, DAY):
+            segments = archive_segments(kind, date(2016, 1, 31))
+            if segments is not None:
+                self.assertEqual(parse_archive_path(segments).kind, kind)
+        month = parse_archive_path(archive_segments(MONTH, date(2016, 12, 5)))
+        self.assertEqual((month.start, month.end), (date(2016, 12, 1), date(2017, 1, 1)))
+        for path in (['2016', 'nope'], ['post'], ['2016', '1', '2', '3', '4']):
+            self.assertIsNone(parse_archive_path(path))
+
+    def test_lists_posts_in_range(self):
+        request = RequestFactory().get('/')
+        request.site = Site.objects.get(is_default_site=True)
+        page, args, kwargs = self.blog.route(request, archive_segments(MONTH, date(2016, 1, 1)))
+        self.assertEqual(page.pk, self.blog.pk)
+        context = self.blog.get_context(request, **kwargs)
+        self.assertEqual([post.pk for post in context['posts']], [self.posts[2].pk, self.posts[1].pk])
+
+    def test_posts_still_route(self):
+        segments = self.posts[1].url_path[len(self.blog.url_path):].strip('/').split('/')
+        self.assertEqual(self.blog.route(RequestFactory().get('/'), segments)[0].pk, self.posts[1].pk)
+
+    def test_month_counts(self):
+        self.assertEqual(compute_month_counts(self.blog.path), [(2016, 2, 1), (2016, 1, 2), (2015, 12, 1)])
+        self.assertEqual(get_month_counts(self.blog.pk), [(2016, 2, 1), (2016, 1, 2), (2015, 12, 1)])
+
+    def test_month_counts_follow_saves(self):
+        first, second, third, fourth = self.posts
+        third.date = date(2016, 2, 2)
+        third.save()
+        self.assertEqual(get_month_counts(self.blog.pk), [(2016, 2, 2), (2016, 1, 1), (2015, 12, 1)])
+        first.unpublish()
+        fourth.delete()
+        self.assertEqual(get_month_counts(self.blog.pk), [(2016, 2, 1), (2016, 1, 1)])
+        self.assertEqual(rebuild_month_counts(self.blog), 2)
+        self.assertEqual(get_month_counts(self.blog.pk), [(2016, 2, 1), (2016, 1, 1)])
+
+    def test_moves_between_blogs(self):
+        other = self.blog.get_parent().add_child(instance=BlogType(title="Other", slug='other'))
+        self.posts[0].move(other, pos='last-child')
+        self.assertEqual(get_month_counts(self.blog.pk), [(2016, 2, 1), (2016, 1, 2)])
+        self.assertEqual(get_month_counts(other.pk), [(2015, 12, 1)])
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.site = Site.objects.get(is_default_site=True)
+        self.blog = self.site.root_page.add_child(instance=BlogType(title="Blog", slug='blog'))
+        self.other_blog = self.site.root_page.add_child(instance=BlogType(title="Other", slug='other'))
+        self.post = self.blog.add_child(instance=BlogPost(title="Post", slug='post', date=date(2016, 1, 31)))
+
+    def get(self, page, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        request = RequestFactory().get('/', **headers)
+        request.site = self.site
+        with blog_settings_changed(CONDITIONAL_GET=True):
+            return Page.objects.get(pk=page.pk).specific.serve(request)
+
+    def test_not_modified(self):
+        etag = self.get(self.blog)['ETag']
+        self.assertEqual(self.get(self.blog, etag).status_code, 304)
+        etag = self.get(self.post)['ETag']
+        self.assertEqual(self.get(self.post, etag).status_code, 304)
+
+    def test_publish_changes_etag(self):
+        etag = self.get(self.blog)['ETag']
+        post = self.blog.add_child(instance=BlogPost(title="New", slug='new', date=date(2016, 2, 1), live=False))
+        post.save_revision().publish()
+        self.assertEqual(self.get(self.blog, etag).status_code, 200)
+
+    def test_move_changes_etag(self):
+        etags = [self.get(self.blog)['ETag'], self.get(self.other_blog)['ETag']]
+        self.post.move(self.other_blog, pos='last-child')
+        self.assertEqual(self.get(self.blog, etags[0]).status_code, 200)
+        self.assertEqual(self.get(self.other_blog, etags[1]).status_code, 200)
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.key_parts = ('response-cache-test', uuid4().hex)
+
+    def respond(self):
+        self.calls += 1
+        response = HttpResponse('render %d' % self.calls, content_type='text/html; charset=utf-8')
+        response['Cache-Control'] = 'max-age=60'
+        patch_vary_headers(response, ['Accept-Language'])
+        return response
+
+    def serve(self, respond=None, key_parts=None):
+        with blog_settings_changed(RESPONSE_CACHE_ALIAS='default'):
+            return serve_cached(RequestFactory().get('/'), key_parts or self.key_parts, respond or self.respond)
+
+    def test_hit_keeps_headers(self):
+        first = self.serve()
+        second = self.serve()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(second.content, first.content)
+        for header in ('Content-Type', 'Cache-Control', 'Vary'):
+            self.assertEqual(second[header], first[header])
+
+    def test_miss_on_new_key(self):
+        self.serve()
+        self.serve(key_parts=self.key_parts + ('new version',))
+        self.assertEqual(self.calls, 2)
+
+    def test_responses_setting_cookies_are_not_stored(self):
+        def respond():
+            response = self.respond()
+            response.set_cookie('visitor', '1')
+            return response
+        self.serve(respond)
+        self.assertIn('visitor', self.serve(respond).cookies)
+        self.assertEqual(self.calls, 2)
+
+    def test_publish_invalidates(self):
+        site = Site.objects.get(is_default_site=True)
+        blog = site.root_page.add_child(instance=BlogType(title="Blog", slug='blog'))
+        request = RequestFactory().get('/')
+        request.site = site
+        with blog_settings_changed(RESPONSE_CACHE_ALIAS='default'):
+            self.assertNotIn(b'Fresh post', blog.serve(request).content)
+            post = blog.add_child(instance=BlogPost(title="Fresh post", slug='fresh', date=date(2016, 1, 31), live=False))
+            post.save_revision().publish()
+            self.assertIn(b'Fresh post', BlogType.objects.get(pk=blog.pk).serve(request).content)
+
+
+@skipIf(blog_settings.USE_STREAMFIELD, "posts are created with HTML content")
+class FallbackSearchTest(TestCase):
+    def setUp(self):
+        site_root = Site.objects.get(is_default_site=True).root_page
+        self.blog = site_root.add_child(instance=BlogType(title="Blog", slug='blog'))
+        posts = [("Pasta night", "<p>Boil the water.</p>", ['food']),
+                 ("Rye bread", "<p>Made with 100% rye.</p>", ['food', 'baking']),
+                 ("Snake_case names", "<p>Plain text.</p>", [])]
+        self.posts = []
+        for n, (title, body, tags) in enumerate(posts):
+            post = self.blog.add_child(instance=BlogPost(title=title, slug='post-%d' % n, date=date(2016, 1, n + 1), content=body))
+            if blog_settings.USE_TAGS and tags:
+                post.tags.add(*tags)
+                post.save()
+            index_post(post)
+            self.posts.append(post)
+        index_posts(self.posts, self.blog.pk)
+
+    def search(self, query, tag=None):
+        return [post.pk for post in SearchResults(self.blog.pk, query, tag=tag, backend=FallbackBackend())[:10]]
+
+    def test_matches_title_and_body(self):
+        pasta, rye, snake = self.posts
+        self.assertEqual(self.search('water'), [pasta.pk])
+        self.assertEqual(self.search('bread'), [rye.pk])
+
+    @skipUnless(blog_settings.USE_TAGS, "needs tags")
+    def test_tag_filter(self):
+        pasta, rye, snake = self.posts
+        self.assertEqual(self.search('a', tag='food'), [rye.pk, pasta.pk])
+        self.assertEqual(self.search('a', tag='baking'), [rye.pk])
+
+    def test_wildcards_are_literal(self):
+        pasta, rye, snake = self.posts
+        self.assertEqual(self.search('%'), [rye.pk])
+        self.assertEqual(self.search('e_c'), [snake.pk])
+        self.assertEqual(self.search('!'), [])
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        site_root = Site.objects.get(is_default_site=True).root_page
+        self.blog = site_root.add_child(instance=BlogType(title="Blog", slug='blog'))
+        self.other = site_root.add_child(instance=BlogType(title="Other", slug='other'))
+        self.posts = [self.blog.add_child(instance=BlogPost(title="Post %d" % n, slug='post-%d' % n, date=date(2016, 1, n + 1)))
+                      for n in range(3)]
+
+    def plan(self, manifest=None, **values):
+        with blog_settings_changed(POSTS_PER_PAGE=2, **values):
+            return plan_export(manifest or {})
+
+    def dirs(self, tasks):
+        return set(out for page_id, querystring, out in tasks)
+
+    def test_shrinking_listing_removes_pages(self):
+        tasks, stale, manifest = self.plan()
+        self.assertIn('blog/page/2', self.dirs(tasks))
+        self.posts[0].delete()
+        tasks, stale, manifest = self.plan(manifest)
+        self.assertIn('blog/page/2', stale)
+        self.assertNotIn('blog/page/2', self.dirs(tasks))
+
+    def test_unpublished_index_is_removed(self):
+        tasks, stale, manifest = self.plan()
+        self.other.unpublish()
+        tasks, stale, manifest = self.plan(manifest)
+        self.assertIn('other', stale)
+        self.assertNotIn('other', self.dirs(tasks))
+
+    @skipUnless(blog_settings.USE_TAGS, "needs tags")
+    def test_tags_per_blog(self):
+        post = self.posts[0]
+        post.tags.add('solo')
+        post.save()
+        tasks, stale, manifest = self.plan()
+        self.assertIn('blog/tag/solo', self.dirs(tasks))
+        self.assertFalse([out for out in self.dirs(tasks) if out.startswith('other/tag')])
+
+        post.tags.clear()
+        post.save()
+        tasks, stale, manifest = self.plan(manifest)
+        self.assertIn('blog/tag/solo', stale)
+
+    def test_cursor_pagination(self):
+        tasks, stale, manifest = self.plan(USE_CURSOR_PAGINATION=True)
+        pages = [querystring for page_id, querystring, out in tasks if page_id == self.blog.pk]
+        self.assertEqual(len(pages), 3) # page 1, page 2 as next page, page 1 as previous page
+        for querystring in pages:
+            self.assertNotIn('page=', querystring)
+
+        site = Site.objects.get(is_default_site=True)
+        newest = [post.pk for post in reversed(self.posts)][:2]
+        for querystring in pages:
+            request = RequestFactory().get('/?' + querystring)
+            request.site = site
+            with blog_settings_changed(USE_CURSOR_PAGINATION=True, POSTS_PER_PAGE=2):
+                shown = [post.pk for post in self.blog.get_context(request)['posts']]
+            self.assertIn(shown, [newest, [self.posts[0].pk]])
+
+
+class ImportTest(TestCase):
+    EXPORT = (
+        '{"title": "First", "date": "2016-01-01", "body": "One\\n\\nTwo", "tags": ["a", "b"], "category": ["News", "Local"]}\n'
+        '{"title": "Second", "slug": "first", "date": "2016-01-02 10:00:00", "body": "<h2>Head</h2><p>Text</p>", "tags": ["a"]}\n'
+    )
+
+    def setUp(self):
+        site_root = Site.objects.get(is_default_site=True).root_page
+        self.blog = site_root.add_child(instance=BlogType(title="Blog", slug='blog'))
+
+    def test_story_blocks(self):
+        self.assertEqual(story_blocks('One\n\nTwo<h3>Head &amp; more</h3><iframe src="x"></iframe>'), [
+            {'type': 'paragraph', 'value': '<p>One</p><p>Two</p>'},
+            {'type': 'h3', 'value': 'Head & more'},
+            {'type': 'raw_html', 'value': '<iframe src="x"></iframe>'},
+        ])
+
+    def test_imports_and_resumes(self):
+        records = list(read_json(StringIO(self.EXPORT)))
+        self.assertEqual(PostImporter(self.blog).import_chunk(records[:1]), (1, 0))
+        self.assertEqual(PostImporter(self.blog).import_chunk(records), (1, 1))
+
+        posts = BlogPost.objects.child_of(self.blog).order_by('date')
+        self.assertEqual([(post.title, post.slug) for post in posts], [('First', 'first'), ('Second', 'first-2')])
+        self.assertTrue(posts[1].url_path.endswith('/first-2/'))
+
+    def imported_posts(self):
+        PostImporter(self.blog).import_chunk(list(read_json(StringIO(self.EXPORT))))
+        return BlogPost.objects.child_of(self.blog).order_by('date')
+
+    @skipUnless(blog_settings.USE_TAGS, "needs tags")
+    def test_imports_tags(self):
+        self.assertEqual(sorted(tag.name for tag in self.imported_posts()[0].tags.all()), ['a', 'b'])
+
+    @skipUnless(blog_settings.USE_CATEGORIES, "needs categories")
+    def test_imports_categories(self):
+        chain = self.imported_posts()[0].category.get_ancestors(inclusive=True).filter(depth__gt=self.blog.depth)
+        self.assertEqual([category.title for category in chain], ['News', 'Local'])
+
+    @skipUnless(blog_settings.USE_TAGS, "needs tags")
+    def test_tag_slugs_skip_numbered_variants(self):
+        from taggit.models import Tag
+        Tag.objects.create(name='foo', slug='foo')
+        Tag.objects.create(name='Foo!', slug='foo-2')
+        tag_ids = PostImporter(self.blog).get_tag_ids(set(['FOO']))
+        self.assertEqual(Tag.objects.get(pk=tag_ids['FOO']).slug, 'foo-3')
+
+    def test_inline_tags_around_line_breaks(self):
+        self.assertEqual(story_html('<strong>bold<br/></strong>'), '<p><strong>bold</strong></p>')
+        record = json.dumps({'title': "Bold", 'date': '2016-01-03', 'body': '<strong>bold<br/></strong>'})
+        self.assertEqual(PostImporter(self.blog).import_chunk(list(read_json(StringIO(record)))), (1, 0))
+
+    def test_reads_wxr(self):
+        export = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss xmlns:content="http://purl.org/rss/1.0/modules/content/" xmlns:wp="http://wordpress.org/export/1.2/"><channel>'
+            '<wp:category><wp:category_nicename>news</wp:category_nicename><wp:category_parent></wp:category_parent>'
+            '<wp:cat_name>News</wp:cat_name></wp:category>'
+            '<wp:category><wp:category_nicename>local</wp:category_nicename><wp:category_parent>news</wp:category_parent>'
+            '<wp:cat_name>Local</wp:cat_name></wp:category>'
+            '<item><title>First</title><wp:post_name>first</wp:post_name><wp:post_date>2016-01-01 10:00:00</wp:post_date>'
+            '<wp:post_type>post</wp:post_type><wp:status>publish</wp:status><content:encoded>One</content:encoded>'
+            '<category domain="category" nicename="local">Local</category><category domain="post_tag" nicename="a">a</category></item>'
+            '<item><title>Draft</title><wp:post_date>2016-01-02</wp:post_date>'
+            '<wp:post_type>post</wp:post_type><wp:status>draft</wp:status></item>'
+            '</channel></rss>'
+        )
+        records = list(read_wxr(io.BytesIO(export.encode('utf-8'))))
+        self.assertEqual([(record.title, record.slug, record.body, record.tags, record.category) for record in records],
+                         [('First', 'first', 'One', ('a',), ('News', 'Local'))])
+
+
+class RelatedPostsTest(TestCase):
+    def setUp(self):
+        site_root = Site.objects.get(is_default_site=True).root_page
+        self.blog = site_root.add_child(instance=BlogType(title="Blog", slug='blog'))
+        tags = [['common', 'rare'], ['common', 'rare'], ['common'], ['other'], ['common', 'other']]
+        self.posts = []
+        for n, names in enumerate(tags):
+            post = self.blog.add_child(instance=BlogPost(title="Post %d" % n, slug='post-%d' % n, date=date(2016, 1, n + 1)))
+            post.tags.add(*names)
+            post.save()
+            self.posts.append(post)
+
+    def related(self, post):
+        return [related.pk for related in blog_related_posts(post)['posts']]
+
+    @skipUnless(blog_settings.USE_TAGS, "needs tags")
+    def test_rare_tags_count_more(self):
+        rebuild_related(self.blog)
+        first, second, third, fourth, fifth = self.posts
+        self.assertEqual(self.related(first), [second.pk, fifth.pk, third.pk])
+        with self.assertNumQueries(1):
+            self.related(first)
+
+    @skipUnless(blog_settings.USE_TAGS, "needs tags")
+    def test_partial_index_scores_like_full_index(self):
+        full = TermIndex(self.blog.path)
+        for post in self.posts:
+            partial = TermIndex(self.blog.path, post_ids=[post.pk])
+            self.assertEqual(partial.related(post.pk, 5), full.related(post.pk, 5))
+
+    @skipUnless(blog_settings.USE_TAGS, "needs tags")
+    def test_incremental_update(self):
+        rebuild_related(self.blog)
+        third = self.posts[2]
+        third.tags.add('rare')
+        third.save()
+        update_related(third)
+        self.assertEqual(self.related(self.posts[0])[:2], [third.pk, self.posts[1].pk])
+        self.assertEqual(self.related(third)[:2], [self.posts[1].pk, self.posts[0].pk])
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Query counts of the main blog views must stay within blog.benchmark.query_budgets however
+    many posts there are. Set BLOG_BENCHMARK_POSTS to run against a bigger blog; the
+    benchmark_blog command also reports latency.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = generate_blog(posts=int(os.environ.get('BLOG_BENCHMARK_POSTS', 60)), tags=10, images=5)
+
+    def test_query_budgets(self):
+        for name, timings, queries, budget in run_benchmarks(self.data, repeat=1):
+            self.assertLessEqual(queries, budget, "%s ran %d queries, budget %d" % (name, queries, budget))
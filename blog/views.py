@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.shortcuts import render
+
+from blog import settings
+from blog.instrumentation import sample_report
+
+
+def instrumentation_report(request):
+    return render(request, 'blog/admin/instrumentation_report.html', {
+        'report': sample_report(),
+        'samples': settings.INSTRUMENTATION_SAMPLES,
+    })
@@ -1,6 +1,12 @@
 from wagtail.wagtailcore import hooks
 from django.utils.html import format_html, format_html_join
 from django.conf import settings
+from django.conf.urls import url
+from django.core.urlresolvers import reverse
+from wagtail.wagtailadmin.menu import MenuItem
+
+from blog import settings as blog_settings
+from blog import views
 
 @hooks.register('insert_editor_js')
 def editor_js():
@@ -20,4 +26,14 @@ def editor_js():
                 hallorequireparagraphs: {blockElements: ['p','ol','ul']}
             };
         </script>
-    """
\ No newline at end of file
+    """
+if blog_settings.INSTRUMENTATION:
+    @hooks.register('register_admin_urls')
+    def register_instrumentation_url():
+        return [
+            url(r'^blog/timings/$', views.instrumentation_report, name='blog_instrumentation_report'),
+        ]
+
+    @hooks.register('register_settings_menu_item')
+    def register_instrumentation_menu_item():
+        return MenuItem('Blog timings', reverse('blog_instrumentation_report'), classnames='icon icon-time', order=1000)